@@ -0,0 +1,142 @@
+"""
+Compare how long each download archive format takes to write with its size.
+
+Archives every notebook downloaded by ``proc_examples.py`` (run it with
+``--skip-exec`` first) in each format and compression level, and reports the
+total time taken and total size of the archives. ``"gz"`` archives are written
+twice: once with an empty blob store, and once more reusing the compressed
+members from the first pass, as happens when notebooks are regenerated.
+
+Usage::
+
+    python source/_ext/benchmark_archives.py [--csv=<path>] [<format>:<level> ...]
+"""
+
+import csv
+import shutil
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import List, Tuple
+
+sys.path.append(str(Path(__file__).parent))
+
+from cookbook.archives import write_archive
+from cookbook.notebook import find_notebooks
+from cookbook.globals_ import *
+from proc_examples import needed_files
+
+DEFAULT_CONFIGS: List[Tuple[str, int | None]] = [
+    ("gz", 1),
+    ("gz", 6),
+    ("gz", 9),
+    ("pigz", 6),
+    ("pigz", 9),
+    ("zstd", 3),
+    ("zstd", 10),
+    ("zstd", 19),
+    ("zip", 6),
+    ("zip", 9),
+]
+"""Formats and levels to compare when none are given on the command line."""
+
+
+def benchmark(
+    notebooks: List[Path],
+    archive_format: str,
+    level: int | None,
+    blob_root: Path,
+    out_dir: Path,
+) -> Tuple[float, int]:
+    """Archive all the notebooks, returning the time taken and total size"""
+    script_path = Path(__file__).parent / "run_notebook.sh"
+    shutil.rmtree(out_dir, ignore_errors=True)
+    out_dir.mkdir(parents=True)
+
+    start = perf_counter()
+    for i, notebook in enumerate(notebooks):
+        write_archive(
+            out_dir / f"{i}{ARCHIVE_FORMATS[archive_format]}",
+            [*needed_files(notebook), (script_path, Path(script_path.name))],
+            archive_format,
+            level,
+            blob_root=blob_root,
+        )
+    duration = perf_counter() - start
+
+    return duration, sum(path.stat().st_size for path in out_dir.iterdir())
+
+
+def main(configs: List[Tuple[str, int | None]], csv_path: Path | None = None):
+    if not SRC_IPYNB_ROOT.exists():
+        raise ValueError(f"{SRC_IPYNB_ROOT} does not exist; run proc_examples.py first")
+    notebooks = [
+        notebook
+        for notebook in find_notebooks(SRC_IPYNB_ROOT)
+        if str(notebook.relative_to(SRC_IPYNB_ROOT)) not in SKIP_NOTEBOOKS
+    ]
+    if not notebooks:
+        raise ValueError(
+            f"No notebooks in {SRC_IPYNB_ROOT}; run proc_examples.py first"
+        )
+    print(f"Archiving {len(notebooks)} notebooks")
+
+    rows = []
+    with TemporaryDirectory() as tmp:
+        for archive_format, level in configs:
+            blob_root = Path(tmp) / f"blobs-{archive_format}-{level}"
+            passes = ["cold", "warm"] if archive_format == "gz" else ["cold"]
+            for blob_store in passes:
+                try:
+                    duration, size = benchmark(
+                        notebooks, archive_format, level, blob_root, Path(tmp) / "out"
+                    )
+                except FileNotFoundError as e:
+                    print(f"Skipping {archive_format}: {e}")
+                    break
+                rows.append(
+                    {
+                        "format": archive_format,
+                        "level": "default" if level is None else level,
+                        "blob_store": blob_store if archive_format == "gz" else "",
+                        "seconds": round(duration, 3),
+                        "mebibytes": round(size / 1024**2, 3),
+                    }
+                )
+                print(
+                    f"{archive_format:>5} {rows[-1]['level']:>7}",
+                    f"{rows[-1]['blob_store']:>4}",
+                    f"{duration:8.2f} s {size / 1024**2:10.2f} MiB",
+                )
+
+    if csv_path is not None:
+        with open(csv_path, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=[*rows[0]])
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    # --csv is the path to store the results in
+    csv_path = None
+    for arg in sys.argv[1:]:
+        if arg.startswith("--csv="):
+            csv_path = Path(arg[6:])
+    if "--csv" in sys.argv:
+        raise ValueError("Specify path in a single argument: `--csv=<path>`")
+
+    # Any other arguments are formats to benchmark, with an optional level
+    configs: List[Tuple[str, int | None]] = []
+    for arg in sys.argv[1:]:
+        if arg.startswith("--"):
+            continue
+        archive_format, _, level = arg.partition(":")
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(
+                f"Unknown archive format {archive_format};"
+                + f" try one of {[*ARCHIVE_FORMATS]}"
+            )
+        configs.append((archive_format, int(level) if level else None))
+
+    main(configs or DEFAULT_CONFIGS, csv_path)
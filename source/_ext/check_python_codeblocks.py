@@ -15,58 +15,698 @@ snippets don't have to initialize them, and then sets up an import hook that
 deletes the added names if `openff.toolkit` is imported in the code block. This
 means that short snippets can assume some common variables are in scope, but
 long code blocks intended to be self-sufficient can opt out of this name
-pollution by importing the toolkit.
-"""
+pollution by importing the toolkit. Only the variables a code block reads
+without first defining them itself are set up, so code blocks that use none of
+them don't wait for the toolkit to load force fields.
 
-# Define the default namespace
-import openff.toolkit
-from openff.toolkit import ForceField, Molecule, Topology
+Setting up the variables takes much longer than most snippets take to run, so
+by default the script hands its standard streams to a server that has already
+set them up, and exits with the snippet's exit code. The server forks a fresh
+child for each snippet, so snippets can't affect each other, and exits after
+it has been idle for `SERVER_IDLE_TIMEOUT` seconds. The child takes on this
+script's environment variables, working directory and arguments before running
+the snippet. The server is started on demand, and a new one is started
+whenever this script, the Python interpreter or the versions of the packages
+in `CACHE_KEY_DISTRIBUTIONS` change. Pass `--no-server` to
+run the snippet in this process instead, or `--serve` to run the server. The
+server's socket, lock file and log are kept in `$XDG_RUNTIME_DIR`, or in a
+directory in the system's temporary directory that only the user can access.
 
-molecule = Molecule.from_smiles("C123C(C1)(C2)C3")
-topology = Topology.from_molecules([molecule])
-force_field = ForceField("openff_unconstrained-2.2.0.offxml")
-ff_unconstrained = force_field
-ff_constrained = ForceField("openff-2.2.0.offxml")
+Code blocks that have succeeded before are not run again. The script records
+each code block that succeeds in `CACHE_DIR`, under a hash of the code block,
+this script, the Python version and the versions of the packages in
+`CACHE_KEY_DISTRIBUTIONS`, and exits immediately when it sees that hash again.
+Failures are never cached, so their errors are always reported. Pass
+`--no-cache` to run every code block.
+"""
 
-# Set the import hook
 import builtins
 import sys
 
-_old_import = __import__
-_already_deleted = False
-
-
-def __import__(name, *args, **kwargs):
-    """
-    Clear above variables on any new import of the toolkit
-    """
-    global _already_deleted
-    if name.startswith("openff.toolkit") and not _already_deleted:
-        global \
-            molecule, \
-            topology, \
-            force_field, \
-            ForceField, \
-            Molecule, \
-            Topology, \
-            ff_constrained, \
-            ff_unconstrained
-        del (
-            molecule,
-            topology,
-            force_field,
-            ForceField,
-            Molecule,
-            Topology,
-            ff_constrained,
-            ff_unconstrained,
+SERVER_IDLE_TIMEOUT = 120
+"""Seconds the server waits for another snippet before exiting."""
+
+SERVER_START_TIMEOUT = 300
+"""Seconds to wait for a newly started server to be ready."""
+
+CACHE_DIR = "build/codeblocks"
+"""
+Path to record the code blocks that have succeeded in.
+
+Relative to the root of the openff-docs repository.
+"""
+
+CACHE_MAX_ENTRIES = 10_000
+"""Number of successful code blocks to remember; the least recent are forgotten."""
+
+CACHE_CHECK_INTERVAL = 100
+"""Successful code blocks recorded, on average, between checks of the cache's size."""
+
+CACHE_KEY_DISTRIBUTIONS = [
+    "openff-toolkit",
+    "openff-forcefields",
+    "openff-interchange",
+    "openff-units",
+]
+"""Packages whose versions may change whether a code block succeeds."""
+
+
+DEFAULT_NAMES = [
+    "openff",
+    "ForceField",
+    "Molecule",
+    "Topology",
+    "molecule",
+    "topology",
+    "force_field",
+    "ff_unconstrained",
+    "ff_constrained",
+]
+"""Names in the default namespace."""
+
+
+def _module_bindings(statements: list, bindings: dict):
+    """
+    Record where names are first bound by module-level statements.
+
+    Each name is mapped to the end of the first statement that binds it, since
+    an assignment's value is evaluated before its target is bound. Function
+    and class bodies and comprehensions have their own scopes, so they are not
+    searched; the bodies of ``if``, ``for``, ``with`` and ``try`` statements
+    are.
+    """
+    import ast
+
+    for statement in statements:
+        end = (statement.end_lineno, statement.end_col_offset)
+        if isinstance(statement, (ast.Import, ast.ImportFrom)):
+            names = [
+                alias.asname or alias.name.partition(".")[0]
+                for alias in statement.names
+            ]
+        else:
+            if isinstance(statement, ast.Assign):
+                targets = statement.targets
+            elif isinstance(statement, (ast.AnnAssign, ast.For, ast.AsyncFor)):
+                targets = [statement.target]
+            elif isinstance(statement, (ast.With, ast.AsyncWith)):
+                targets = [item.optional_vars for item in statement.items]
+            else:
+                targets = []
+            names = [
+                node.id
+                for target in targets
+                if target is not None
+                for node in ast.walk(target)
+                if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)
+            ]
+            if isinstance(
+                statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+            ):
+                names.append(statement.name)
+        for name in names:
+            bindings[name] = min(bindings.get(name, end), end)
+
+        if not isinstance(
+            statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+        ):
+            for field in ["body", "orelse", "finalbody"]:
+                _module_bindings(getattr(statement, field, []), bindings)
+            for handler in getattr(statement, "handlers", []):
+                _module_bindings(handler.body, bindings)
+
+
+def used_default_names(code: str) -> set:
+    """
+    Get the names in the default namespace that a code block reads.
+
+    Names the code block binds itself before it first reads them, by
+    assigning or importing them, are left out, so that code blocks that set
+    up their own force field don't wait for the default ones. Code blocks that
+    can't be parsed don't need any, since they'll fail anyway.
+
+    >>> sorted(used_default_names("print(molecule.to_smiles())"))
+    ['molecule']
+    >>> sorted(used_default_names(
+    ...     "force_field = ForceField('openff-2.2.0.offxml')\\n"
+    ...     "force_field.create_openmm_system(topology)"
+    ... ))
+    ['ForceField', 'topology']
+    >>> sorted(used_default_names(
+    ...     "from openff.toolkit import ForceField, Molecule\\n"
+    ...     "molecule = Molecule.from_smiles('CCO')\\n"
+    ...     "force_field = ForceField('openff-2.2.0.offxml')\\n"
+    ...     "print(force_field.label_molecules(molecule.to_topology()))"
+    ... ))
+    []
+    >>> define_default_namespace(used_default_names(
+    ...     "force_field = None\\nprint(force_field)"
+    ... ))
+    {}
+    >>> sorted(used_default_names("molecule = molecule.canonical_order_atoms()"))
+    ['molecule']
+    """
+    import ast
+
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return set()
+
+    # Where each name is first read; deleting a name also needs it to exist
+    reads: dict = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Store):
+            position = (node.lineno, node.col_offset)
+        elif isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name):
+            node, position = node.target, (node.lineno, node.col_offset)
+        else:
+            continue
+        reads[node.id] = min(reads.get(node.id, position), position)
+
+    bindings: dict = {}
+    _module_bindings(tree.body, bindings)
+
+    return {
+        name
+        for name, position in reads.items()
+        if name in DEFAULT_NAMES and not bindings.get(name, position) < position
+    }
+
+
+def define_default_namespace(names=DEFAULT_NAMES) -> dict:
+    """
+    Get the default namespace
+
+    Only the names in ``names`` are defined, along with the toolkit's classes.
+    The toolkit isn't even imported if ``names`` is empty.
+    """
+    names = set(names)
+    if not names:
+        return {}
+
+    import openff.toolkit
+    from openff.toolkit import ForceField, Molecule, Topology
+
+    namespace = {
+        "openff": openff,
+        "ForceField": ForceField,
+        "Molecule": Molecule,
+        "Topology": Topology,
+    }
+    if names & {"molecule", "topology"}:
+        namespace["molecule"] = Molecule.from_smiles("C123C(C1)(C2)C3")
+    if "topology" in names:
+        namespace["topology"] = Topology.from_molecules([namespace["molecule"]])
+    if names & {"force_field", "ff_unconstrained"}:
+        namespace["force_field"] = ForceField("openff_unconstrained-2.2.0.offxml")
+        namespace["ff_unconstrained"] = namespace["force_field"]
+    if "ff_constrained" in names:
+        namespace["ff_constrained"] = ForceField("openff-2.2.0.offxml")
+    return namespace
+
+
+def import_hook(namespace: dict):
+    """Get an import hook that clears the default names from ``namespace``"""
+    old_import = builtins.__import__
+    already_deleted = False
+
+    def __import__(name, *args, **kwargs):
+        """
+        Clear above variables on any new import of the toolkit
+        """
+        nonlocal already_deleted
+        if name.startswith("openff.toolkit") and not already_deleted:
+            # Only the names the code block mentions were defined
+            for default in [
+                "molecule",
+                "topology",
+                "force_field",
+                "ForceField",
+                "Molecule",
+                "Topology",
+                "ff_constrained",
+                "ff_unconstrained",
+            ]:
+                namespace.pop(default, None)
+            already_deleted = True
+
+        return old_import(name, *args, **kwargs)
+
+    return __import__
+
+
+def run_snippet(code: str, defaults: dict):
+    """
+    Set the import hook and execute a code block.
+
+    The code block runs in a fresh namespace holding only ``defaults``, so it
+    can't see this script's imports and variables.
+    """
+    namespace = {"__name__": "__main__", "__builtins__": builtins, **defaults}
+    builtins.__import__ = import_hook(namespace)
+    exec(code, namespace)
+
+
+def _script_hash() -> str:
+    """Get the SHA-256 hash of this script"""
+    import hashlib
+
+    with open(__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def server_dir() -> str | None:
+    """
+    Get a directory only the current user can access to put the server in.
+
+    This is ``$XDG_RUNTIME_DIR`` if it is set, or a directory in the system's
+    temporary directory otherwise. Returns ``None`` if the directory in the
+    temporary directory exists but belongs to someone else or is accessible
+    to other users, so that they can't intercept code blocks.
+    """
+    import os
+    import stat
+    import tempfile
+
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return runtime_dir
+
+    path = os.path.join(tempfile.gettempdir(), f"openff-docs-codeblocks-{os.getuid()}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        return None
+    return path
+
+
+def _distribution_versions() -> str:
+    """Get the versions of the packages in ``CACHE_KEY_DISTRIBUTIONS``"""
+    import importlib.metadata
+
+    versions = []
+    for distribution in CACHE_KEY_DISTRIBUTIONS:
+        try:
+            version = importlib.metadata.version(distribution)
+        except importlib.metadata.PackageNotFoundError:
+            version = ""
+        versions.append(f"{distribution}=={version}")
+    return "\0".join(versions)
+
+
+def server_path() -> str | None:
+    """
+    Get the path to the server's socket, or ``None`` if there's nowhere safe.
+
+    The path depends on this script's contents, the Python interpreter and the
+    versions of the packages in ``CACHE_KEY_DISTRIBUTIONS``, so a server left
+    over from before any of them changed is never used. The server's lock and
+    log files sit alongside it.
+    """
+    import hashlib
+    import os
+
+    directory = server_dir()
+    if directory is None:
+        return None
+    hasher = hashlib.sha256(_script_hash().encode())
+    hasher.update(b"\0" + sys.executable.encode())
+    hasher.update(b"\0" + _distribution_versions().encode())
+    key = hasher.hexdigest()[:16]
+    return os.path.join(directory, f"openff-docs-codeblocks-{key}.sock")
+
+
+def cache_path(code: str) -> str:
+    """
+    Get the path that records whether a code block has succeeded.
+
+    The path depends on the code block, this script, the Python version and
+    the versions of the packages in ``CACHE_KEY_DISTRIBUTIONS``.
+    """
+    import hashlib
+    import os
+
+    hasher = hashlib.sha256(_script_hash().encode())
+    hasher.update(b"\0" + sys.version.encode())
+    hasher.update(b"\0" + _distribution_versions().encode())
+    hasher.update(b"\0" + code.encode())
+    key = hasher.hexdigest()
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+    return os.path.join(root, CACHE_DIR, key[:2], key)
+
+
+def cache_hit(path: str) -> bool:
+    """Check whether a code block has succeeded, marking it as recently used"""
+    import os
+
+    try:
+        os.utime(path)
+    except OSError:
+        return False
+    return True
+
+
+def cache_success(path: str, max_entries: int = CACHE_MAX_ENTRIES):
+    """
+    Record that a code block has succeeded.
+
+    Now and then, if the cache holds more than ``max_entries`` code blocks,
+    the least recently used are forgotten. Safe to call from several processes
+    at once.
+    """
+    import glob
+    import os
+    import random
+    import tempfile
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    os.replace(tmp, path)
+
+    # Listing the cache is slow, so only check its size on a random fraction
+    # of calls; the cache may briefly grow a little past the limit
+    if random.randrange(CACHE_CHECK_INTERVAL):
+        return
+    root = os.path.dirname(os.path.dirname(path))
+    entries = [
+        entry
+        for entry in glob.glob(os.path.join(root, "*", "*"))
+        if not entry.endswith(".tmp")
+    ]
+    if len(entries) <= max_entries:
+        return
+    mtimes = {}
+    for entry in entries:
+        try:
+            mtimes[entry] = os.stat(entry).st_mtime
+        except FileNotFoundError:
+            pass
+    # Evict down to 90% so that the next check is likely to find room
+    for entry in sorted(mtimes, key=mtimes.get)[: len(mtimes) - max_entries * 9 // 10]:
+        try:
+            os.unlink(entry)
+        except FileNotFoundError:
+            pass
+
+
+def _exit_code(exc: SystemExit) -> int:
+    """Get the exit code the interpreter would use for an uncaught SystemExit"""
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    print(exc.code, file=sys.stderr)
+    return 1
+
+
+def _run_child(fds: list, request: dict, defaults: dict):
+    """
+    Run a snippet with the client's standard streams in a forked server.
+
+    The client's environment variables, working directory and arguments are
+    applied first, so the snippet sees what it would have in the client.
+    """
+    import os
+    import traceback
+
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    os.environ.clear()
+    os.environ.update(request["env"])
+    os.chdir(request["cwd"])
+    sys.argv = request["argv"]
+    code = request["code"]
+
+    # The server defined every name, but code blocks only get those they use
+    # and, as in define_default_namespace, the toolkit's classes
+    used = used_default_names(code)
+    defaults = {
+        name: value
+        for name, value in defaults.items()
+        if name in used
+        or (used and name in {"openff", "ForceField", "Molecule", "Topology"})
+    }
+
+    try:
+        run_snippet(code, defaults)
+        exit_code = 0
+    except SystemExit as e:
+        exit_code = _exit_code(e)
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    os._exit(exit_code)
+
+
+def _recv_exactly(conn, size: int, data: bytes = b"") -> bytes | None:
+    """Receive until ``data`` is ``size`` bytes, or return ``None`` on EOF"""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def serve(path: str, idle_timeout: float = SERVER_IDLE_TIMEOUT):
+    """
+    Run snippets sent by clients until none have been sent for a while.
+
+    Each client sends the snippet and its working directory, and passes its
+    standard input, output and error to the server, which forks a child to
+    run the snippet with them. The child's exit code is sent back to the
+    client once it finishes. The server's own output goes to a log file next
+    to ``path``.
+    """
+    import fcntl
+    import json
+    import os
+    import selectors
+    import socket
+    import struct
+    from time import monotonic
+
+    # Only one server may listen at each path
+    lock = open(f"{path}.lock", "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return
+
+    log = os.open(f"{path}.log", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.dup2(log, 1)
+    os.dup2(log, 2)
+    os.close(log)
+
+    defaults = define_default_namespace()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen()
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    children: dict = {}
+    last_active = monotonic()
+
+    try:
+        while True:
+            if children:
+                # pidfds wake us up when a child exits; otherwise, poll
+                timeout = None if hasattr(os, "pidfd_open") else 0.01
+            else:
+                timeout = last_active + idle_timeout - monotonic()
+                if timeout <= 0:
+                    break
+
+            for key, _ in selector.select(timeout):
+                if key.fileobj is listener:
+                    conn, _ = listener.accept()
+                    # The request's length comes with the streams
+                    header, fds, _, _ = socket.recv_fds(conn, 4, 3)
+                    header = _recv_exactly(conn, 4, header)
+                    request = None
+                    if header is not None:
+                        (size,) = struct.unpack("!I", header)
+                        request = _recv_exactly(conn, size)
+                    if request is None or len(fds) != 3:
+                        for fd in fds:
+                            os.close(fd)
+                        conn.close()
+                        continue
+                    request = json.loads(request)
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                    pid = os.fork()
+                    if pid == 0:
+                        listener.close()
+                        _run_child(fds, request, defaults)
+                    for fd in fds:
+                        os.close(fd)
+                    children[pid] = conn
+                    if hasattr(os, "pidfd_open"):
+                        selector.register(os.pidfd_open(pid), selectors.EVENT_READ)
+                else:
+                    selector.unregister(key.fileobj)
+                    os.close(key.fileobj)
+
+            for pid, conn in [*children.items()]:
+                done, status = os.waitpid(pid, os.WNOHANG)
+                if done:
+                    try:
+                        conn.sendall(
+                            struct.pack("!i", os.waitstatus_to_exitcode(status))
+                        )
+                    except OSError:
+                        pass
+                    conn.close()
+                    del children[pid]
+                    last_active = monotonic()
+    finally:
+        os.unlink(path)
+        listener.close()
+
+
+def _server_running(path: str) -> bool:
+    """Check whether a server holds the lock for ``path``"""
+    import fcntl
+
+    try:
+        with open(f"{path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return True
+    return False
+
+
+def _connect(path: str):
+    """Connect to the server at ``path``, or return ``None``"""
+    import socket
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except OSError:
+        client.close()
+        return None
+    return client
+
+
+def run_client(path: str, code: str) -> int | None:
+    """
+    Run a snippet in the server, starting it if needed.
+
+    Returns the snippet's exit code, or ``None`` if the server couldn't be
+    reached before the snippet was sent. This is as soon as the server exits
+    while starting, in which case its log explains why.
+    """
+    import json
+    import os
+    import socket
+    import struct
+    import subprocess
+    from time import monotonic, sleep
+
+    client = _connect(path)
+    if client is None:
+        # The server mustn't hold on to our output, or our caller would wait
+        # for it to exit; it writes its own log instead
+        server = subprocess.Popen(
+            [sys.executable, __file__, "--serve"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
         )
-        _already_deleted = True
+        deadline = monotonic() + SERVER_START_TIMEOUT
+        while client is None and monotonic() < deadline:
+            sleep(0.1)
+            client = _connect(path)
+            # Our server exits straight away if another is already starting,
+            # so give up only once no server holds the lock
+            if (
+                client is None
+                and server.poll() is not None
+                and not _server_running(path)
+            ):
+                client = _connect(path)
+                break
+        if client is None:
+            return None
+
+    request = json.dumps(
+        {
+            "env": dict(os.environ),
+            "cwd": os.getcwd(),
+            "argv": sys.argv,
+            "code": code,
+        }
+    ).encode()
+    with client:
+        socket.send_fds(
+            client,
+            [struct.pack("!I", len(request))],
+            [sys.stdin.fileno(), sys.stdout.fileno(), sys.stderr.fileno()],
+        )
+        client.sendall(request)
+        reply = _recv_exactly(client, 4)
+    if reply is None:
+        print("Code block checker server exited unexpectedly", file=sys.stderr)
+        return 1
+    (exit_code,) = struct.unpack("!i", reply)
+    # Report snippets killed by a signal the way a shell would
+    return exit_code if exit_code >= 0 else 128 - exit_code
+
+
+def main() -> int:
+    """Check the code block on standard input, and return its exit code"""
+    import os
+    import socket
+
+    server_supported = hasattr(os, "fork") and hasattr(socket, "send_fds")
+
+    if "--serve" in sys.argv:
+        path = server_path()
+        if path is not None:
+            serve(path)
+        return 0
+
+    code = sys.stdin.read()
+
+    # Code blocks that have succeeded before will succeed again
+    cached = None if "--no-cache" in sys.argv else cache_path(code)
+    if cached is not None and cache_hit(cached):
+        return 0
 
-    return _old_import(name, *args, **kwargs)
+    exit_code = None
+    path = server_path() if server_supported else None
+    if path is not None and "--no-server" not in sys.argv:
+        exit_code = run_client(path, code)
+    if exit_code is None:
+        # Execute the code block in this process
+        run_snippet(code, define_default_namespace(used_default_names(code)))
+        exit_code = 0
 
+    if cached is not None and exit_code == 0:
+        cache_success(cached)
+    return exit_code
 
-builtins.__import__ = __import__
 
-# Execute the code block
-exec(sys.stdin.read())
+if __name__ == "__main__":
+    exit(main())
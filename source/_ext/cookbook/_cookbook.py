@@ -7,9 +7,11 @@ from pathlib import Path
 from sphinx.application import Sphinx
 from sphinx.config import Config
 
-from .github import download_dir
+from .blobs import hash_file
+from .github import sync_paths
 from .notebook import (
-    insert_cell,
+    insert_cells,
+    new_cell,
     get_metadata,
     find_notebooks,
     notebook_download,
@@ -26,13 +28,12 @@ from .globals_ import (
 )
 
 
-def inject_tags_index(notebook: dict) -> dict:
-    """Inject an `index` directive containing the notebook's metadata tags"""
+def tags_index_cell(notebook: dict) -> dict:
+    """Create an `index` directive containing the notebook's metadata tags"""
 
     tags = get_metadata(notebook, "tags", ["untagged"])
 
-    return insert_cell(
-        notebook,
+    return new_cell(
         cell_type="markdown",
         source=[
             f"```{{index}} {', '.join(tags)}",
@@ -41,7 +42,7 @@ def inject_tags_index(notebook: dict) -> dict:
     )
 
 
-def inject_links(app: Sphinx, notebook: dict, docpath: Path) -> dict:
+def links_cell(app: Sphinx, notebook: dict, docpath: Path) -> dict:
     user, repo, *path = str(docpath.relative_to(EXEC_IPYNB_ROOT)).split("/")
     path = "/".join(path)
 
@@ -59,8 +60,7 @@ def inject_links(app: Sphinx, notebook: dict, docpath: Path) -> dict:
     )
     colab_uri = colab_uri + f"/{cache_branch}/{colab_path}"
 
-    return insert_cell(
-        notebook,
+    return new_cell(
         cell_type="markdown",
         source=[
             f"{{ .notebook-links }}",
@@ -71,9 +71,8 @@ def inject_links(app: Sphinx, notebook: dict, docpath: Path) -> dict:
     )
 
 
-def inject_experimental_warning(notebook: dict) -> dict:
-    return insert_cell(
-        notebook,
+def experimental_warning_cell() -> dict:
+    return new_cell(
         cell_type="markdown",
         source=[
             "```{admonition} Experimental",
@@ -93,11 +92,12 @@ def process_notebook(app: Sphinx, docname: str, source: list[str]):
 
     notebook = json.loads(source[0])
 
-    notebook = inject_links(app, notebook, docpath)
-    notebook = inject_tags_index(notebook)
-
+    cells = [tags_index_cell(notebook), links_cell(app, notebook, docpath)]
     if "/experimental/" in docname:
-        notebook = inject_experimental_warning(notebook)
+        cells.insert(0, experimental_warning_cell())
+
+    # The notebook was parsed just for us, so there's no need to copy it
+    insert_cells(notebook, cells, inplace=True)
 
     # Tell Sphinx we don't expect this notebook to show up in a toctree
     set_metadata(notebook, "orphan", True)
@@ -107,26 +107,29 @@ def process_notebook(app: Sphinx, docname: str, source: list[str]):
 
 def download_cached_notebooks(app: Sphinx, config: Config):
     """
-    Download notebooks from the cache iff they do not exist.
+    Download notebooks from the cache if they do not exist or are out of date.
 
-    Note that the cache is not checked for changes; if you want to refresh the
-    cache, you must manually delete it.
+    Notebooks that were downloaded from the cache by an earlier build are
+    brought up to date, downloading only the files that changed; this costs a
+    single request to GitHub when nothing has. Notebooks that exist but were
+    not downloaded from the cache, such as those written by proc_examples.py,
+    are left alone. See :func:`sync_paths`.
     """
+    # Work out everything we need, and then sync it all in one go
+    paths = {}
     for directory in [
         COLAB_IPYNB_ROOT,
         EXEC_IPYNB_ROOT,
         DOWNLOAD_IPYNB_ROOT,
     ]:
         for repo in GITHUB_REPOS:
-            repo, _, tag = repo.partition("#")
-            repo_directory = directory / repo
-            if not repo_directory.exists():
-                download_dir(
-                    "openforcefield/openff-docs",
-                    str(repo_directory.relative_to(OPENFF_DOCS_ROOT)),
-                    repo_directory,
-                    refspec=DEFAULT_CACHE_BRANCH,
-                )
+            repo_directory = directory / repo.partition("#")[0]
+            paths[str(repo_directory.relative_to(OPENFF_DOCS_ROOT))] = repo_directory
+    sync_paths(
+        "openforcefield/openff-docs",
+        paths,
+        refspec=DEFAULT_CACHE_BRANCH,
+    )
 
     # Exclude notebooks from linkcheck
     config["linkcheck_exclude_documents"].extend(
@@ -135,7 +138,34 @@ def download_cached_notebooks(app: Sphinx, config: Config):
 
 
 def find_notebook_docnames(app, env, docnames):
-    """Find the downloaded notebooks and make sure Sphinx sees them"""
+    """
+    Find the downloaded notebooks and make sure Sphinx reads the changed ones
+
+    Notebooks that are new to the environment, or whose contents differ from
+    when they were last read, are added to ``docnames``. Downloaded notebooks
+    may be older than when they were last read even if they've changed, so
+    Sphinx can't rely on modification times alone. The size, modification
+    time and hash of each notebook are stored on the environment as
+    ``env.cookbook_notebooks``, so unchanged notebooks aren't hashed again.
+    """
+    # Notebooks may have been downloaded since the last search
+    find_notebooks.cache_clear()
+    old_notebooks: dict[str, tuple] = getattr(env, "cookbook_notebooks", {})
+    notebooks: dict[str, tuple] = {}
     for path in find_notebooks(EXEC_IPYNB_ROOT):
         docname = env.project.path2doc(str(path))
-        docnames.append(docname)
+        if docname is None:
+            continue
+
+        stat = path.stat()
+        old = old_notebooks.get(docname)
+        if old is not None and old[:2] == (stat.st_size, stat.st_mtime_ns):
+            digest = old[2]
+        else:
+            digest = hash_file(path)
+        notebooks[docname] = (stat.st_size, stat.st_mtime_ns, digest)
+
+        changed = old is None or old[2] != digest
+        if (docname not in env.all_docs or changed) and docname not in docnames:
+            docnames.append(docname)
+    env.cookbook_notebooks = notebooks
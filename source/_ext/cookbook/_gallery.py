@@ -10,10 +10,98 @@ from docutils.parsers.rst.directives import choice
 from sphinx.application import Sphinx
 
 from ._cookbook import find_notebooks
-from .globals_ import EXEC_IPYNB_ROOT
+from .globals_ import EXEC_IPYNB_ROOT, THUMBNAIL_FILENAME
 from .utils import flatten
 
 
+def index_gallery(app: Sphinx, env: BuildEnvironment, docnames: list[str]):
+    """
+    Index the notebooks in the cookbook once per build.
+
+    The index is stored on the environment as ``env.cookbook_gallery``, which
+    maps the docname of each notebook to a dict with the notebook's
+    ``"source_repo"``, ``"thumbnail_uri"``, ``"category"`` and ``"tags"``. The
+    category and tags come from the notebook's metadata, so they are filled in
+    by :func:`update_gallery_metadata` once every notebook has been read.
+    """
+    old_gallery: dict[str, dict] = getattr(env, "cookbook_gallery", {})
+    gallery: dict[str, dict] = {}
+    for path in find_notebooks(EXEC_IPYNB_ROOT):
+        docname = env.path2doc(str(path))
+        if docname is None:
+            continue
+
+        thumbnail = path.with_name(THUMBNAIL_FILENAME)
+        _, source_repo, *_ = str(path.relative_to(EXEC_IPYNB_ROOT)).split("/")
+
+        gallery[docname] = {
+            "source_repo": source_repo,
+            "thumbnail_uri": (
+                str(thumbnail.relative_to(env.srcdir)) if thumbnail.is_file() else None
+            ),
+            # Carry these over until the notebook's metadata is read
+            "category": old_gallery.get(docname, {}).get("category", "uncategorized"),
+            "tags": old_gallery.get(docname, {}).get("tags", []),
+        }
+
+    # Pages with a cookbook register its thumbnails when they're read, so they
+    # must be re-read if the notebooks or their thumbnails have changed
+    def thumbnails(gallery: dict[str, dict]) -> dict[str, str | None]:
+        return {docname: entry["thumbnail_uri"] for docname, entry in gallery.items()}
+
+    if thumbnails(gallery) != thumbnails(old_gallery):
+        docnames.extend(
+            docname
+            for docname in getattr(env, "cookbook_gallery_pages", set())
+            if docname not in docnames
+        )
+
+    env.cookbook_gallery = gallery
+
+
+def update_gallery_metadata(app: Sphinx, env: BuildEnvironment) -> list[str]:
+    """
+    Fill in the category and tags of each notebook in the cookbook index.
+
+    Returns the pages with a cookbook if any notebook's category or tags have
+    changed, so that Sphinx writes them again.
+    """
+    changed = False
+    for docname, entry in getattr(env, "cookbook_gallery", {}).items():
+        metadata = env.metadata.get(docname, {})
+        # "uncategorized" is a special category for notebooks whose metadata
+        # doesn't specify a category
+        category = metadata.get("category", "uncategorized")
+        tags = metadata.get("tags", [])
+        if (category, tags) != (entry["category"], entry["tags"]):
+            changed = True
+            entry["category"] = category
+            entry["tags"] = tags
+
+    if changed:
+        return [*getattr(env, "cookbook_gallery_pages", set())]
+    return []
+
+
+def purge_gallery_page(app: Sphinx, env: BuildEnvironment, docname: str):
+    """Forget that a page has a cookbook, ready for it to be re-read"""
+    getattr(env, "cookbook_gallery_pages", set()).discard(docname)
+
+
+def merge_gallery_pages(
+    app: Sphinx,
+    env: BuildEnvironment,
+    docnames: list[str],
+    other: BuildEnvironment,
+):
+    """Collect the pages with a cookbook from a parallel reader process"""
+    if not hasattr(env, "cookbook_gallery_pages"):
+        env.cookbook_gallery_pages = set()
+    env.cookbook_gallery_pages.update(
+        getattr(other, "cookbook_gallery_pages", set()) & {*docnames}
+    )
+
+
 class CookbookDirective(SphinxDirective):
     """
     Directive to draw thumbnails of the cookbook.
@@ -36,13 +124,19 @@ class CookbookDirective(SphinxDirective):
     has_content = False
 
     def run(self):
-        node = CookbookNode(categories=self.options.get("categories", []))
+        # Remember that this page has a cookbook, so that it can be updated
+        # when the notebooks change
+        if not hasattr(self.env, "cookbook_gallery_pages"):
+            self.env.cookbook_gallery_pages = set()
+        self.env.cookbook_gallery_pages.add(self.env.docname)
 
-        for path in find_notebooks(EXEC_IPYNB_ROOT):
-            entry = CookbookEntryNode.from_path(self.env, path)
-            node.append(entry)
+        # Entries are only added when the page is resolved, which is too late
+        # for Sphinx to notice their thumbnails, so register them now
+        for entry in getattr(self.env, "cookbook_gallery", {}).values():
+            if entry["thumbnail_uri"] is not None:
+                self.env.images.add_file(self.env.docname, entry["thumbnail_uri"])
 
-        return [node]
+        return [CookbookNode(categories=self.options.get("categories", []))]
 
 
 class CookbookNode(docutils.nodes.Element):
@@ -97,30 +191,22 @@ class CookbookEntryNode(docutils.nodes.Element):
                     if thumbnail_uri is None
                     else thumbnail_uri,
                     alt="",
-                    candidates={"?": ""},
+                    # Local thumbnails are copied into the build by Sphinx
+                    candidates={"?": ""}
+                    if thumbnail_uri is None
+                    else {"*": thumbnail_uri},
                     classes=["output", "image_png"],
                 )
             ]
         )
 
     @classmethod
-    def from_path(cls, env: BuildEnvironment, path: Path) -> "CookbookEntryNode":
-        docname = env.path2doc(str(path))
-
-        if docname is None:
-            raise ValueError(
-                f"path {path} is not a document in this Sphinx environment.",
-            )
-
-        if path.with_name("thumbnail.png").is_file():
-            thumbnail_uri = str(path.with_name("thumbnail.png").relative_to(env.srcdir))
-        else:
-            thumbnail_uri = None
-
-        _, source_repo, *_ = str(path.relative_to(EXEC_IPYNB_ROOT)).split("/")
-
+    def from_index(cls, docname: str, entry: dict) -> "CookbookEntryNode":
+        """Create an entry from the gallery index built by :func:`index_gallery`"""
         return cls(
-            docname=docname, source_repo=source_repo, thumbnail_uri=thumbnail_uri
+            docname=docname,
+            source_repo=entry["source_repo"],
+            thumbnail_uri=entry["thumbnail_uri"],
         )
 
     @staticmethod
@@ -162,8 +248,8 @@ def proc_cookbook_toctree(
     doctree: sphinx.addnodes.document,
     docname: str,
 ):
-    """Update the cookbook with URIs and titles"""
-    metadata = app.env.metadata
+    """Fill in the cookbook from the gallery index, with URIs and titles"""
+    gallery: dict[str, dict] = getattr(app.env, "cookbook_gallery", {})
 
     cookbook_nodes = [*doctree.findall(CookbookNode)]
 
@@ -173,26 +259,20 @@ def proc_cookbook_toctree(
     for cookbook_node in cookbook_nodes:
         cookbook_categories = cookbook_node.categories
 
-        if cookbook_categories:
-            # "uncategorised" is a special category for notebooks whose metadata
-            # doesn't specify a category
-            cookbook_entries_with_categories = (
-                (entry, metadata[entry.docname].get("category", "uncategorized"))
-                for entry in cookbook_node.children
+        # "other" is a special category for cookbook directives that should
+        # include all notebooks not rendered in any other category on the
+        # current page.
+        # TODO: Make this all notebooks not rendered in the entire project?
+        cookbook_node.extend(
+            CookbookEntryNode.from_index(entry_docname, entry)
+            for entry_docname, entry in gallery.items()
+            if not cookbook_categories
+            or entry["category"] in cookbook_categories
+            or (
+                "other" in cookbook_categories
+                and entry["category"] not in categories_on_page
             )
-            # "other" is a special category for cookbook directives that should
-            # include all notebooks not rendered in any other category on the
-            # current page.
-            # TODO: Make this all notebooks not rendered in the entire project?
-            cookbook_node.children = [
-                entry
-                for entry, entry_category in cookbook_entries_with_categories
-                if entry_category in cookbook_categories
-                or (
-                    "other" in cookbook_categories
-                    and entry_category not in categories_on_page
-                )
-            ]
+        )
 
         for entry in cookbook_node.children:
             entry.title = app.env.titles[entry.docname].astext()
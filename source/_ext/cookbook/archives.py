@@ -0,0 +1,189 @@
+"""Download archives in each of the ``ARCHIVE_FORMATS`` for proc_examples.py"""
+
+import os
+import shutil
+import stat
+import subprocess
+import tarfile
+import time
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple
+from zipfile import ZIP_DEFLATED, ZipFile, ZipInfo
+
+from .blobs import write_tgz
+from .globals_ import ARCHIVE_FORMATS, ARCHIVE_MTIME, BLOB_STORE_ROOT
+
+TarFilter = Callable[[tarfile.TarInfo], Optional[tarfile.TarInfo]]
+
+
+def archive_mtime() -> int:
+    """
+    Get the modification time to give every member of a reproducible archive.
+
+    This is ``SOURCE_DATE_EPOCH`` if it is set, or ``ARCHIVE_MTIME`` otherwise.
+    See https://reproducible-builds.org/docs/source-date-epoch/
+    """
+    return int(os.environ.get("SOURCE_DATE_EPOCH", ARCHIVE_MTIME))
+
+
+def _normalized_mode(is_dir: bool, mode: int) -> int:
+    """Get the permissions a member of a reproducible archive should have"""
+    if is_dir or mode & stat.S_IXUSR:
+        return 0o755
+    return 0o644
+
+
+def reproducible_tarinfo(mtime: int) -> TarFilter:
+    """
+    Get a ``tarfile`` filter that strips everything specific to this machine.
+
+    The filter gives each member the modification time ``mtime``, root
+    ownership, and the permissions of ``_normalized_mode``.
+    """
+
+    def normalize(tarinfo: tarfile.TarInfo) -> tarfile.TarInfo:
+        tarinfo.mtime = mtime
+        tarinfo.uid = tarinfo.gid = 0
+        tarinfo.uname = tarinfo.gname = ""
+        tarinfo.mode = _normalized_mode(tarinfo.isdir(), tarinfo.mode)
+        return tarinfo
+
+    return normalize
+
+
+def _compressor_command(archive_format: str, level: Optional[int]) -> List[str]:
+    """Get the command that compresses a tarball for a format, or raise"""
+    if archive_format == "pigz":
+        # Leave the file name and timestamp out of the header
+        command = ["pigz", "--no-name"]
+    elif archive_format == "zstd":
+        # Use as many threads as there are cores
+        command = ["zstd", "--quiet", "-T0"]
+    else:
+        raise ValueError(f"{archive_format} archives are not written by a command")
+
+    if shutil.which(command[0]) is None:
+        raise FileNotFoundError(
+            f"{command[0]} must be installed to write {archive_format} archives"
+        )
+
+    if level is not None:
+        command.append(f"-{level}")
+    return command
+
+
+def _write_piped_tar(
+    path: Path,
+    files: Iterable[Tuple[Path, Path]],
+    command: List[str],
+    filter: Optional[TarFilter] = None,
+):
+    """Write a tarball of some files to ``path``, compressed by ``command``"""
+    with open(path, "wb") as archive:
+        compressor = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=archive)
+        assert compressor.stdin is not None
+        try:
+            with tarfile.open(fileobj=compressor.stdin, mode="w|") as tar:
+                for src, arcname in files:
+                    tar.add(src, arcname=str(arcname), filter=filter)
+        finally:
+            compressor.stdin.close()
+            returncode = compressor.wait()
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, command)
+
+
+def _write_zip(
+    path: Path,
+    files: Iterable[Tuple[Path, Path]],
+    level: Optional[int],
+    mtime: Optional[int] = None,
+):
+    """
+    Write a zip file of some files to ``path``.
+
+    If ``mtime`` is given, every member gets that modification time and the
+    permissions of ``_normalized_mode``, so the zip file is reproducible.
+    """
+    with ZipFile(path, "w", compression=ZIP_DEFLATED, compresslevel=level) as zip_file:
+
+        def add(src: Path, arcname: Path):
+            if mtime is None:
+                zip_file.write(src, arcname=arcname)
+            else:
+                zinfo = ZipInfo.from_file(src, arcname=arcname)
+                # Zip files can't represent times before 1980
+                zinfo.date_time = max(time.gmtime(mtime)[:6], (1980, 1, 1, 0, 0, 0))
+                zinfo.create_system = 3
+                mode = _normalized_mode(zinfo.is_dir(), zinfo.external_attr >> 16)
+                if zinfo.is_dir():
+                    zinfo.external_attr = (stat.S_IFDIR | mode) << 16 | 0x10
+                    zip_file.writestr(zinfo, b"")
+                else:
+                    zinfo.external_attr = (stat.S_IFREG | mode) << 16
+                    zip_file.writestr(
+                        zinfo,
+                        src.read_bytes(),
+                        compress_type=ZIP_DEFLATED,
+                        compresslevel=level,
+                    )
+            if src.is_dir():
+                for name in sorted(os.listdir(src)):
+                    add(src / name, arcname / name)
+
+        for src, arcname in files:
+            add(src, arcname)
+
+
+def write_archive(
+    path: Path,
+    files: Iterable[Tuple[Path, Path]],
+    archive_format: str,
+    level: Optional[int] = None,
+    reproducible: bool = True,
+    blob_root: Path = BLOB_STORE_ROOT,
+):
+    """
+    Write an archive of some files to ``path``.
+
+    ``files`` is a list of 2-tuples of paths like that returned by
+    ``proc_examples.needed_files``; the first path of each tuple is added to
+    the archive under the name given by the second. Directories are added
+    recursively.
+
+    ``archive_format`` is a key of ``ARCHIVE_FORMATS``, and ``level`` is the
+    compression level, or ``None`` for the format's default. ``"gz"`` archives
+    reuse compressed members from the blob store in ``blob_root``.
+
+    If ``reproducible`` is ``True``, the archive's bytes depend only on the
+    names, contents and executable bits of the files: members are sorted,
+    their modification times are set by :func:`archive_mtime`, and their
+    ownership and permissions are normalized.
+    """
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(
+            f"Unknown archive format {archive_format};"
+            + f" try one of {[*ARCHIVE_FORMATS]}"
+        )
+
+    mtime = None
+    if reproducible:
+        files = sorted(files, key=lambda pair: str(pair[1]))
+        mtime = archive_mtime()
+    filter = None if mtime is None else reproducible_tarinfo(mtime)
+
+    if archive_format == "gz":
+        with open(path, "wb") as archive:
+            write_tgz(
+                archive,
+                files,
+                compresslevel=9 if level is None else level,
+                root=blob_root,
+                filter=filter,
+            )
+    elif archive_format == "zip":
+        _write_zip(path, files, level, mtime)
+    else:
+        _write_piped_tar(
+            path, files, _compressor_command(archive_format, level), filter
+        )
@@ -0,0 +1,200 @@
+"""Content-addressed store of files shared between notebooks for proc_examples.py"""
+
+import errno
+import gzip
+import io
+import os
+import shutil
+import stat
+import tarfile
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from time import time
+from typing import BinaryIO, Callable, Dict, Iterable, Optional, Tuple
+from uuid import uuid4
+
+from .globals_ import BLOB_STORE_ROOT, BLOB_STORE_MAX_AGE
+
+_hashes: Dict[Tuple[int, int, int, int], str] = {}
+"""Hashes of files already read, keyed by device, inode, size and mtime."""
+
+
+def hash_file(path: Path) -> str:
+    """Get the SHA-256 hash of the contents of a file"""
+    st = os.stat(path)
+    stat_key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    if stat_key not in _hashes:
+        hasher = sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                hasher.update(chunk)
+        _hashes[stat_key] = hasher.hexdigest()
+    return _hashes[stat_key]
+
+
+def _store(dst: Path, write: Callable[[BinaryIO], None], mode: int = 0o444):
+    """
+    Create ``dst`` by passing a temporary file to ``write``, unless it exists.
+
+    The temporary file is atomically moved into place, so concurrent writers
+    never see a partially written blob. Blobs are read only, so that editing a
+    file linked into the store fails rather than quietly changing it everywhere.
+    """
+    if dst.exists():
+        os.utime(dst)
+        return
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    with NamedTemporaryFile(dir=dst.parent, suffix=".tmp", delete=False) as tmp:
+        write(tmp)
+    os.chmod(tmp.name, mode)
+    os.replace(tmp.name, dst)
+
+
+def store_file(path: Path, root: Path = BLOB_STORE_ROOT) -> Path:
+    """Add a copy of a file to the store, returning the path to the blob"""
+    mode = 0o555 if os.stat(path).st_mode & stat.S_IXUSR else 0o444
+    key = hash_file(path)
+    dst = root / "files" / key[:2] / f"{key}-{mode:o}"
+
+    def write(tmp: BinaryIO):
+        with open(path, "rb") as src:
+            shutil.copyfileobj(src, tmp)
+
+    _store(dst, write, mode)
+    return dst
+
+
+def link_file(src: Path, dst: Path, root: Path = BLOB_STORE_ROOT) -> Path:
+    """
+    Create ``dst`` as a hard link to a blob with the contents of ``src``.
+
+    Falls back to copying the blob if it can't be hard linked, such as when
+    ``dst`` is on a different file system to the store. The link or copy is
+    made under a temporary name and atomically moved into place, so an
+    existing ``dst`` is replaced rather than written through, even if another
+    writer creates ``dst`` at the same time. Has the same signature as
+    ``shutil.copy2``, so it can be used as the ``copy_function`` of
+    ``shutil.copytree``.
+    """
+    blob = store_file(Path(src), root)
+    dst = Path(dst)
+    tmp = dst.with_name(f".{dst.name}.{uuid4().hex}.tmp")
+    try:
+        os.link(blob, tmp)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM):
+            raise
+        shutil.copy2(blob, tmp)
+    try:
+        os.replace(tmp, dst)
+    finally:
+        # Renaming does nothing if dst is already a link to the same blob
+        tmp.unlink(missing_ok=True)
+    return dst
+
+
+def compressed_member(
+    path: Path, compresslevel: int = 9, root: Path = BLOB_STORE_ROOT
+) -> Path:
+    """
+    Get a gzip member holding the contents of a file as stored in a tarball.
+
+    The member holds the file's contents padded to a whole number of tar
+    blocks, so that it can be placed straight after the file's tar header in a
+    multi-member gzip stream.
+    """
+    key = hash_file(path)
+    dst = root / "gz" / key[:2] / f"{key}-{compresslevel}.gz"
+
+    def write(tmp: BinaryIO):
+        # Leave the temporary file's name out of the header
+        with gzip.GzipFile(
+            filename="", fileobj=tmp, mode="wb", compresslevel=compresslevel, mtime=0
+        ) as gz:
+            with open(path, "rb") as src:
+                shutil.copyfileobj(src, gz)
+            remainder = gz.tell() % tarfile.BLOCKSIZE
+            if remainder:
+                gz.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+
+    _store(dst, write)
+    return dst
+
+
+def write_tgz(
+    fileobj: BinaryIO,
+    files: Iterable[Tuple[Path, Path]],
+    compresslevel: int = 9,
+    root: Path = BLOB_STORE_ROOT,
+    filter: Optional[Callable[[tarfile.TarInfo], Optional[tarfile.TarInfo]]] = None,
+):
+    """
+    Write a gzipped tarball of some files to ``fileobj``.
+
+    ``files`` is a list of 2-tuples of paths like that returned by
+    ``proc_examples.needed_files``; the first path of each tuple is added to
+    the tarball under the name given by the second. Directories are added
+    recursively. ``filter`` works like the argument of ``TarFile.add``; it
+    may modify each member's header or return ``None`` to leave it out.
+
+    Each gzip member has its modification time set to zero, so the tarball
+    is reproducible if ``filter`` normalizes the headers.
+
+    The tarball is written as a series of gzip members, one for each tar
+    header and one for each file's contents. Since gzip decompresses
+    concatenated members as a single stream, this is an ordinary ``.tgz``
+    file, but the compressed contents of each file can be reused by every
+    tarball it appears in.
+    """
+    # Only used to build tar headers
+    headers = tarfile.TarFile(fileobj=io.BytesIO(), mode="w")
+    # Length of the uncompressed tarball so far
+    offset = 0
+
+    def write_member(data: bytes):
+        nonlocal offset
+        fileobj.write(gzip.compress(data, compresslevel=compresslevel, mtime=0))
+        offset += len(data)
+
+    def add(path: Path, arcname: Path):
+        nonlocal offset
+        tarinfo = headers.gettarinfo(path, arcname=str(arcname))
+        if filter is not None:
+            tarinfo = filter(tarinfo)
+            if tarinfo is None:
+                return
+        write_member(tarinfo.tobuf(headers.format, headers.encoding, headers.errors))
+        if tarinfo.isreg():
+            with open(compressed_member(path, compresslevel, root), "rb") as member:
+                shutil.copyfileobj(member, fileobj)
+            blocks, remainder = divmod(tarinfo.size, tarfile.BLOCKSIZE)
+            offset += (blocks + (remainder > 0)) * tarfile.BLOCKSIZE
+        elif tarinfo.isdir():
+            for name in sorted(os.listdir(path)):
+                add(path / name, arcname / name)
+
+    for path, arcname in files:
+        add(path, arcname)
+
+    # End of archive marker, padded to a whole record like tarfile does
+    end = 2 * tarfile.BLOCKSIZE
+    end += -(offset + end) % tarfile.RECORDSIZE
+    write_member(tarfile.NUL * end)
+
+
+def prune_blobs(root: Path = BLOB_STORE_ROOT, max_age: float = BLOB_STORE_MAX_AGE):
+    """
+    Remove blobs that are no longer used from the store.
+
+    Files that are not hard linked from anywhere else are removed, as are
+    compressed members that have not been used for ``max_age`` seconds.
+    """
+    for path in root.glob("files/*/*"):
+        if path.stat().st_nlink <= 1:
+            path.unlink(missing_ok=True)
+
+    now = time()
+    for path in root.glob("gz/*/*"):
+        if now - path.stat().st_mtime > max_age:
+            path.unlink(missing_ok=True)
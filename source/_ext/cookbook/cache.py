@@ -0,0 +1,108 @@
+"""Content-addressed cache of executed notebooks for proc_examples.py"""
+
+import os
+import shutil
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from time import time
+from typing import Iterable, Optional, Tuple
+
+from .globals_ import EXEC_CACHE_ROOT, EXEC_CACHE_MAX_AGE, EXEC_CACHE_MAX_BYTES
+
+CACHE_FORMAT_VERSION = "1"
+"""Bump this to invalidate every existing cache entry."""
+
+
+def _walk_files(path: Path, arcname: Path) -> Iterable[Tuple[Path, Path]]:
+    """Yield all the files in ``path`` in a stable order, with their arcnames"""
+    if path.is_dir():
+        for child in sorted(path.iterdir()):
+            yield from _walk_files(child, arcname / child.name)
+    else:
+        yield path, arcname
+
+
+def hash_files(files: Iterable[Tuple[Path, Path]], *extra: str) -> str:
+    """
+    Hash the contents and names of some files, along with some extra strings.
+
+    ``files`` is a list of 2-tuples of paths like that returned by
+    ``proc_examples.needed_files``; the first path of each tuple is hashed
+    under the name given by the second. Directories are hashed recursively.
+    """
+    hasher = sha256(CACHE_FORMAT_VERSION.encode())
+    for string in extra:
+        hasher.update(b"\0" + string.encode())
+
+    for path, arcname in sorted(files, key=lambda pair: str(pair[1])):
+        for file, file_arcname in _walk_files(path, arcname):
+            hasher.update(b"\0" + str(file_arcname).encode() + b"\0")
+            with open(file, "rb") as f:
+                while chunk := f.read(1024 * 1024):
+                    hasher.update(chunk)
+
+    return hasher.hexdigest()
+
+
+def cached_notebook_path(key: str, root: Path = EXEC_CACHE_ROOT) -> Path:
+    """Get the path where the executed notebook for ``key`` is cached"""
+    return root / key[:2] / f"{key}.ipynb"
+
+
+def fetch_cached_notebook(key: str, root: Path = EXEC_CACHE_ROOT) -> Optional[Path]:
+    """
+    Get the path to the cached notebook for ``key``, or ``None`` on a miss.
+
+    A hit refreshes the entry's modification time so that it is evicted last.
+    """
+    path = cached_notebook_path(key, root)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def store_cached_notebook(key: str, notebook: Path, root: Path = EXEC_CACHE_ROOT):
+    """
+    Store a copy of the executed notebook at ``notebook`` in the cache.
+
+    The copy is written to a temporary file and then atomically moved into
+    place, so concurrent workers never see a partially written entry.
+    """
+    dst = cached_notebook_path(key, root)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    with NamedTemporaryFile(dir=dst.parent, suffix=".tmp", delete=False) as tmp:
+        with open(notebook, "rb") as src:
+            shutil.copyfileobj(src, tmp)
+    os.replace(tmp.name, dst)
+
+
+def evict_cache(
+    root: Path = EXEC_CACHE_ROOT,
+    max_bytes: int = EXEC_CACHE_MAX_BYTES,
+    max_age: float = EXEC_CACHE_MAX_AGE,
+):
+    """
+    Remove stale entries from the cache.
+
+    Entries that have not been used for ``max_age`` seconds are removed, and
+    then the least recently used entries are removed until the cache is no
+    larger than ``max_bytes``.
+    """
+    now = time()
+    entries = []
+    for path in root.glob("*/*.ipynb"):
+        stat = path.stat()
+        if now - stat.st_mtime > max_age:
+            path.unlink(missing_ok=True)
+        else:
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
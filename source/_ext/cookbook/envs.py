@@ -0,0 +1,186 @@
+"""Conda environments and Jupyter kernels for notebooks for proc_examples.py"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+from hashlib import sha256
+from pathlib import Path
+from typing import List
+
+import yaml
+from jupyter_client.kernelspec import KernelSpecManager, NoSuchKernel
+
+from .globals_ import ENV_CACHE_ROOT, ENV_KERNELS_ROOT, CONDA_EXECUTABLES
+
+READY_MARKER = ".cookbook-ready"
+"""File created in an environment's prefix once it is completely built."""
+
+
+def env_key(env_file: Path) -> str:
+    """
+    Get a hash of the packages and channels of a Conda environment file.
+
+    The environment's name is ignored, as are comments and formatting, so
+    notebooks whose environment files differ only in those ways share an
+    environment.
+    """
+    with open(env_file) as f:
+        spec = yaml.safe_load(f) or {}
+    spec.pop("name", None)
+    spec.pop("prefix", None)
+    return sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def env_kernel_name(env_file: Path) -> str:
+    """Get the name of the kernel registered for a Conda environment file"""
+    return f"cookbook-{env_key(env_file)}"
+
+
+def kernel_prefix(kernel_name: str, root: Path = ENV_CACHE_ROOT) -> Path:
+    """
+    Get the prefix of the environment a kernel runs Python from.
+
+    Kernels for notebook-specific environments are found in ``root`` by name,
+    so their prefix is known before they are built. Other kernels are looked
+    up in Jupyter's kernel specs, with a bare ``python`` meaning this
+    interpreter like it does for Jupyter.
+    """
+    if kernel_name.startswith("cookbook-"):
+        return root / kernel_name.removeprefix("cookbook-")
+    try:
+        executable = KernelSpecManager().get_kernel_spec(kernel_name).argv[0]
+    except NoSuchKernel:
+        return Path(sys.prefix)
+    if executable in ("python", "python3"):
+        return Path(sys.prefix)
+    return Path(shutil.which(executable) or executable).parent.parent
+
+
+def kernel_packages_key(kernel_name: str, root: Path = ENV_CACHE_ROOT) -> str:
+    """
+    Get a hash of the packages installed in a kernel's environment.
+
+    Covers the Conda packages and Python distributions in the environment,
+    including their versions and builds, by the names of their metadata files.
+    Nothing is imported or run, so this is cheap enough to do for every
+    notebook. An environment that hasn't been built yet has no packages.
+    """
+    prefix = kernel_prefix(kernel_name, root)
+    names = sorted(
+        str(path.relative_to(prefix))
+        for pattern in [
+            "conda-meta/*.json",
+            "lib/python*/site-packages/*.dist-info",
+            "lib/python*/site-packages/*.egg-info",
+            "Lib/site-packages/*.dist-info",
+            "Lib/site-packages/*.egg-info",
+        ]
+        for path in prefix.glob(pattern)
+    )
+    return sha256("\n".join(names).encode()).hexdigest()[:16]
+
+
+def conda_executable() -> str:
+    """
+    Find a program to create Conda environments with.
+
+    Tries each of ``CONDA_EXECUTABLES`` in turn, including the ones activated
+    Conda installations point to with ``MAMBA_EXE`` and ``CONDA_EXE``.
+    """
+    for name in CONDA_EXECUTABLES:
+        path = os.environ.get(f"{name.upper()}_EXE") or shutil.which(name)
+        if path:
+            return path
+    raise FileNotFoundError(
+        f"One of {CONDA_EXECUTABLES} must be installed to create environments"
+    )
+
+
+def _create_command(executable: str, prefix: Path, env_file: Path) -> List[str]:
+    """Get the command that creates an environment from an environment file"""
+    if Path(executable).name.startswith("micromamba"):
+        command = [executable, "create", "--yes"]
+    else:
+        # Conda and Mamba only read YAML files with the env subcommand
+        command = [executable, "env", "create"]
+    return command + ["--prefix", str(prefix), "--file", str(env_file)]
+
+
+def write_kernelspec(
+    name: str, prefix: Path, kernels_root: Path = ENV_KERNELS_ROOT
+) -> Path:
+    """
+    Register a kernel that runs Python from the environment at ``prefix``.
+
+    The kernel spec is written under ``kernels_root``, which must be on
+    ``JUPYTER_PATH`` for Jupyter to find it. Returns the spec's directory.
+    """
+    spec_dir = kernels_root / "kernels" / name
+    spec_dir.mkdir(parents=True, exist_ok=True)
+    (spec_dir / "kernel.json").write_text(
+        json.dumps(
+            {
+                "argv": [
+                    str(prefix / "bin" / "python"),
+                    "-m",
+                    "ipykernel_launcher",
+                    "-f",
+                    "{connection_file}",
+                ],
+                "display_name": f"Cookbook ({name})",
+                "language": "python",
+            },
+            indent=2,
+        )
+    )
+    return spec_dir
+
+
+def build_env(
+    env_file: Path,
+    root: Path = ENV_CACHE_ROOT,
+    kernels_root: Path = ENV_KERNELS_ROOT,
+) -> str:
+    """
+    Create the Conda environment for an environment file, unless it exists.
+
+    Environments are built in ``root`` under their :func:`env_key`, so each
+    distinct environment is only built once and is reused by later runs.
+    ``ipykernel`` is installed alongside the packages in the file, and a
+    kernel is registered for the environment in ``kernels_root``. An
+    environment that was only partly built, such as by an interrupted run, is
+    rebuilt from scratch. Returns the name of the kernel.
+    """
+    name = env_kernel_name(env_file)
+    prefix = root / env_key(env_file)
+
+    if not (prefix / READY_MARKER).exists():
+        shutil.rmtree(prefix, ignore_errors=True)
+        prefix.parent.mkdir(parents=True, exist_ok=True)
+        executable = conda_executable()
+        print("Creating environment", prefix, "from", env_file)
+        subprocess.run(
+            _create_command(executable, prefix, env_file),
+            check=True,
+            stdin=subprocess.DEVNULL,
+        )
+        subprocess.run(
+            [
+                executable,
+                "install",
+                "--yes",
+                "--prefix",
+                str(prefix),
+                "--channel",
+                "conda-forge",
+                "ipykernel",
+            ],
+            check=True,
+            stdin=subprocess.DEVNULL,
+        )
+        (prefix / READY_MARKER).touch()
+
+    write_kernelspec(name, prefix, kernels_root)
+    return name
@@ -0,0 +1,362 @@
+"""Notebook execution for proc_examples.py"""
+
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+import asyncio
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Thread
+from time import perf_counter, sleep
+from typing import Any, ContextManager, Deque, Dict, Iterable, Optional, Tuple
+
+from jupyter_client.blocking import BlockingKernelClient
+from jupyter_client.manager import KernelManager
+from nbclient import NotebookClient
+from nbconvert.preprocessors.execute import ExecutePreprocessor
+
+_kernel_start_lock: Optional[ContextManager] = None
+_kernel_start_delay: float = 0.0
+
+
+def init_kernel_start_throttle(lock: Optional[ContextManager], delay: float = 0.0):
+    """
+    Configure how kernel startup is throttled in this process.
+
+    Kernels started by :class:`NotebookExecutor` hold ``lock`` from when they
+    are launched until they are ready to execute code, and then for a further
+    ``delay`` seconds. Sharing a ``multiprocessing.Lock`` between the workers of
+    a pool (for instance, by passing this function as the pool's initializer)
+    means only one kernel picks its ports at a time, without making workers
+    wait for each other once their kernels are running.
+
+    ``lock`` should be an ``asyncio.Lock`` if kernels will be started by
+    :meth:`NotebookExecutor.async_preprocess`, and a ``threading`` or
+    ``multiprocessing`` lock if they'll be started by ``preprocess``.
+
+    Workaround for https://github.com/jupyter/nbconvert/issues/1066
+    """
+    global _kernel_start_lock, _kernel_start_delay
+    _kernel_start_lock = lock
+    _kernel_start_delay = delay
+
+
+PEAK_RSS_EXPRESSION = (
+    "__import__('resource').getrusage(__import__('resource').RUSAGE_SELF).ru_maxrss"
+    " * (1 if __import__('sys').platform == 'darwin' else 1024)"
+)
+"""
+Expression evaluated in a kernel to get its peak resident set size in bytes.
+"""
+
+
+def _parse_timestamp(timestamp: Any) -> Optional[datetime]:
+    """Parse a timestamp recorded by nbclient in a cell's metadata"""
+    if isinstance(timestamp, datetime):
+        return timestamp
+    try:
+        return datetime.fromisoformat(str(timestamp))
+    except ValueError:
+        return None
+
+
+def cell_durations(nb) -> Dict[int, Optional[float]]:
+    """
+    Get the time in seconds each code cell in an executed notebook took to run.
+
+    Computed from the timing metadata nbclient records for each cell. Maps
+    the index of each code cell to its duration, or ``None`` if it wasn't
+    recorded.
+    """
+    durations = {}
+    for index, cell in enumerate(nb.cells):
+        if cell.cell_type != "code":
+            continue
+        timing = cell.get("metadata", {}).get("execution", {})
+        start = _parse_timestamp(timing.get("iopub.status.busy"))
+        stop = _parse_timestamp(timing.get("iopub.status.idle"))
+        if start is None or stop is None:
+            durations[index] = None
+        else:
+            durations[index] = (stop - start).total_seconds()
+    return durations
+
+
+class NotebookExecutor(ExecutePreprocessor):
+    """
+    ExecutePreprocessor that throttles kernel startup and profiles execution.
+
+    See :func:`init_kernel_start_throttle` and :meth:`profile`.
+    """
+
+    kernel_wait_time: float = 0.0
+    """Seconds spent waiting for other kernels to start."""
+    kernel_start_time: float = 0.0
+    """Seconds spent starting this executor's kernel, including any delay."""
+    kernel_peak_rss: Optional[int] = None
+    """Peak resident set size of the kernel in bytes, if it could be measured."""
+    execution_started: Optional[datetime] = None
+    """When execution of the most recent notebook started."""
+    execution_finished: Optional[datetime] = None
+    """When the last cell of the most recent notebook finished."""
+    kernel_env: Optional[Dict[str, str]] = None
+    """Environment variables to set for the kernel, on top of this process's."""
+
+    def _kernel_start_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Add ``kernel_env`` to the keyword arguments for starting a kernel"""
+        if self.kernel_env is not None and "env" not in kwargs:
+            return {**kwargs, "env": {**os.environ, **self.kernel_env}}
+        return kwargs
+
+    def _peak_rss_request(self) -> str:
+        """Ask the kernel for its peak RSS, returning the message ID"""
+        assert self.kc is not None
+        return self.kc.execute(
+            "",
+            silent=True,
+            store_history=False,
+            user_expressions={"peak_rss": PEAK_RSS_EXPRESSION},
+        )
+
+    def _record_peak_rss(self, reply: Optional[dict]):
+        """Record the kernel's peak RSS from the reply to ``_peak_rss_request``"""
+        try:
+            result = reply["content"]["user_expressions"]["peak_rss"]
+            self.kernel_peak_rss = int(result["data"]["text/plain"])
+        except (KeyError, TypeError, ValueError):
+            self.kernel_peak_rss = None
+
+    def profile(self) -> Dict[str, Any]:
+        """
+        Summarise how long the most recent notebook took and what it used.
+
+        Returns a JSON-serializable dict with the total ``"wall_time"``, the
+        ``"kernel_start_time"`` and ``"kernel_wait_time"``, the
+        ``"time_to_first_cell"`` from starting to run the notebook to its first
+        code cell starting, the kernel's ``"peak_rss"`` in bytes, and the
+        ``"cell_times"`` of each code cell by index, all in seconds.
+        """
+        assert self.execution_started is not None
+        assert self.execution_finished is not None
+
+        first_cell = None
+        for cell in self.nb.cells:
+            if cell.cell_type == "code":
+                timing = cell.get("metadata", {}).get("execution", {})
+                first_cell = _parse_timestamp(timing.get("iopub.status.busy"))
+                break
+
+        return {
+            "wall_time": (
+                self.execution_finished - self.execution_started
+            ).total_seconds(),
+            "kernel_start_time": self.kernel_start_time,
+            "kernel_wait_time": self.kernel_wait_time,
+            "time_to_first_cell": (
+                None
+                if first_cell is None
+                else (first_cell - self.execution_started).total_seconds()
+            ),
+            "peak_rss": self.kernel_peak_rss,
+            "cell_times": {
+                str(index): duration
+                for index, duration in cell_durations(self.nb).items()
+            },
+        }
+
+    @contextmanager
+    def setup_kernel(self, **kwargs):
+        cleanup_kc = kwargs.pop("cleanup_kc", self.owns_km)
+        self.execution_started = datetime.now(timezone.utc)
+
+        if self.km is None:
+            self.km = self.create_kernel_manager()
+
+        if not self.km.has_kernel:
+            requested = perf_counter()
+            with _kernel_start_lock or nullcontext():
+                acquired = perf_counter()
+                self.start_new_kernel(**self._kernel_start_kwargs(kwargs))
+                self.start_new_kernel_client()
+                sleep(_kernel_start_delay)
+            self.kernel_wait_time = acquired - requested
+            self.kernel_start_time = perf_counter() - acquired
+
+        # The kernel is already running, so this just handles cleanup
+        with super().setup_kernel(cleanup_kc=cleanup_kc, **kwargs):
+            yield
+            self.execution_finished = datetime.now(timezone.utc)
+            self._record_peak_rss(self.wait_for_reply(self._peak_rss_request()))
+
+    @asynccontextmanager
+    async def async_setup_kernel(self, **kwargs):
+        cleanup_kc = kwargs.pop("cleanup_kc", self.owns_km)
+        self.execution_started = datetime.now(timezone.utc)
+
+        if self.km is None:
+            self.km = self.create_kernel_manager()
+
+        if not self.km.has_kernel:
+            requested = perf_counter()
+            async with _kernel_start_lock or nullcontext():
+                acquired = perf_counter()
+                await self.async_start_new_kernel(**self._kernel_start_kwargs(kwargs))
+                await self.async_start_new_kernel_client()
+                await asyncio.sleep(_kernel_start_delay)
+            self.kernel_wait_time = acquired - requested
+            self.kernel_start_time = perf_counter() - acquired
+
+        # The kernel is already running, so this just handles cleanup
+        async with super().async_setup_kernel(cleanup_kc=cleanup_kc, **kwargs):
+            yield
+            self.execution_finished = datetime.now(timezone.utc)
+            reply = await self.async_wait_for_reply(self._peak_rss_request())
+            self._record_peak_rss(reply)
+
+    async def async_preprocess(self, nb, resources=None, km=None):
+        """Asynchronous equivalent of ``preprocess``"""
+        NotebookClient.__init__(self, nb, km)
+        self._check_assign_resources(resources)
+        await self.async_execute()
+        return self.nb, self.resources
+
+
+WARMUP_TEMPLATE = """
+def __cookbook_warmup():
+    import importlib
+    for module in {modules!r}:
+        try:
+            importlib.import_module(module)
+        except Exception:
+            pass
+__cookbook_warmup()
+del __cookbook_warmup
+"""
+"""Code run in each warm kernel; imports modules without adding any names."""
+
+
+def _pool_key(
+    kernel_name: str, env: Dict[str, str]
+) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    """Get the key of the warm kernels with a kernel name and environment"""
+    return kernel_name, tuple(sorted(env.items()))
+
+
+class WarmKernelPool:
+    """
+    Kernels that are started and warmed up before they are needed.
+
+    Each kernel has imported the modules in ``modules`` before it is handed
+    out, so notebooks don't each pay for the heavy imports. Kernels are handed
+    out by :meth:`take` for exactly one notebook each; the caller is
+    responsible for shutting the kernel down afterwards. Every time a kernel is
+    taken, a replacement is started in the background so that it can start
+    and warm up while the taken kernel is in use.
+    """
+
+    def __init__(self, modules: Iterable[str], size: int = 1):
+        self.warmup_code: str = WARMUP_TEMPLATE.format(modules=[*modules])
+        """Code run in each kernel as soon as it is started."""
+        self.size: int = size
+        """Number of warm kernels to keep ready for each kernel name and environment."""
+        self.wait_time: float = 0.0
+        """Seconds the most recent call to :meth:`take` spent waiting."""
+        self._ready: Dict[
+            Tuple[str, Tuple[Tuple[str, str], ...]],
+            Deque[Tuple[KernelManager, BlockingKernelClient, str]],
+        ] = defaultdict(deque)
+        self._fillers: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Thread] = {}
+
+    def _start(self, kernel_name: str, env: Dict[str, str]):
+        """Start a kernel and begin warming it up without waiting for it"""
+        km = KernelManager(kernel_name=kernel_name)
+        with _kernel_start_lock or nullcontext():
+            km.start_kernel(env={**os.environ, **env})
+            kc = km.client()
+            kc.start_channels()
+            kc.wait_for_ready(timeout=60)
+            sleep(_kernel_start_delay)
+        msg_id = kc.execute(self.warmup_code, silent=True, store_history=False)
+        self._ready[_pool_key(kernel_name, env)].append((km, kc, msg_id))
+
+    def fill(self, kernel_name: str, env: Optional[Dict[str, str]] = None):
+        """
+        Start kernels until ``size`` are warming up for ``kernel_name``
+
+        Kernels are started with the environment variables in ``env`` set on
+        top of this process's.
+        """
+        env = env or {}
+        while len(self._ready[_pool_key(kernel_name, env)]) < self.size:
+            self._start(kernel_name, env)
+
+    def _fill_in_background(self, kernel_name: str, env: Dict[str, str]):
+        """Start a thread that runs :meth:`fill` without waiting for it"""
+        filler = Thread(target=self.fill, args=(kernel_name, env), daemon=True)
+        self._fillers[_pool_key(kernel_name, env)] = filler
+        filler.start()
+
+    def _wait_for_filler(self, key: Tuple[str, Tuple[Tuple[str, str], ...]]):
+        """Wait for any kernels being started in the background for ``key``"""
+        filler = self._fillers.pop(key, None)
+        if filler is not None:
+            filler.join()
+
+    def take(
+        self,
+        kernel_name: str,
+        path: Path,
+        timeout: float = 600,
+        env: Optional[Dict[str, str]] = None,
+    ) -> KernelManager:
+        """
+        Get a warm kernel whose working directory is ``path``.
+
+        The kernel was started with the environment variables in ``env`` set.
+        The returned kernel is no longer managed by the pool.
+        """
+        start = perf_counter()
+        env = env or {}
+        # If starting the replacement failed in the background, starting it
+        # here raises the error
+        self._wait_for_filler(_pool_key(kernel_name, env))
+        self.fill(kernel_name, env)
+        km, kc, warmup_id = self._ready[_pool_key(kernel_name, env)].popleft()
+
+        # Start the next kernel while this one is in use, without making this
+        # notebook wait for it
+        self._fill_in_background(kernel_name, env)
+
+        try:
+            # Wait for the warm up to finish, then move to the notebook's
+            # directory so relative paths work as they would in a new kernel
+            while (
+                kc.get_shell_msg(timeout=timeout)["parent_header"].get("msg_id")
+                != warmup_id
+            ):
+                pass
+            kc.execute(
+                f"import os as __os; __os.chdir({str(path)!r}); del __os",
+                silent=True,
+                store_history=False,
+                reply=True,
+                timeout=timeout,
+            )
+        except Exception:
+            km.shutdown_kernel(now=True)
+            raise
+        finally:
+            kc.stop_channels()
+
+        self.wait_time = perf_counter() - start
+        return km
+
+    def shutdown(self):
+        """Shut down all the kernels in the pool"""
+        for key in [*self._fillers]:
+            self._wait_for_filler(key)
+        for ready in self._ready.values():
+            while ready:
+                km, kc, _ = ready.popleft()
+                kc.stop_channels()
+                km.shutdown_kernel(now=True)
@@ -1,16 +1,272 @@
 """Code for working with GitHub in both the Sphinx extension and proc_examples.py"""
 
-import shutil
-from pathlib import Path
-from typing import Generator, Union
-from tempfile import TemporaryDirectory
+import json
+import os
+import tarfile
+import threading
+from collections import defaultdict
+from hashlib import sha1
+from pathlib import Path, PurePosixPath
+from typing import Dict, Generator, List, Mapping, Tuple, Union
+from tempfile import TemporaryFile
 from importlib import import_module
 
+from git.cmd import Git
+from git.exc import GitCommandError
 from git.repo import Repo
 import requests
 from packaging.version import Version
 
-from .utils import next_or_none
+from .globals_ import (
+    CACHE_STAMP_PATH,
+    GIT_CACHE_ROOT,
+    GITHUB_API_URL,
+    TAG_CACHE_ROOT,
+)
+
+_mirror_locks: Dict[Path, threading.Lock] = defaultdict(threading.Lock)
+_fetched: Dict[Tuple[Path, str], str] = {}
+_sessions = threading.local()
+
+
+def github_url(src_repo: str) -> str:
+    """Get the URL to clone a GitHub repository from"""
+    return f"https://github.com/{src_repo}.git"
+
+
+def mirror_path(url: str, root: Path = GIT_CACHE_ROOT) -> Path:
+    """Get the path to the local bare mirror of the repository at ``url``"""
+    name = url.rstrip("/").removesuffix(".git").rpartition("/")[2]
+    return root / f"{name}-{sha1(url.encode()).hexdigest()[:8]}.git"
+
+
+def fetch_commit(
+    url: str,
+    refspec: Union[str, None] = None,
+    root: Path = GIT_CACHE_ROOT,
+) -> Tuple[Repo, str]:
+    """
+    Fetch a reference into the local mirror of a repository.
+
+    The mirror is a bare repository in ``root`` that persists between calls
+    and runs, so only objects that are not already present are downloaded.
+    Each reference is fetched at most once per process. Returns the mirror
+    and the SHA of the fetched commit.
+    """
+    path = mirror_path(url, root)
+    refspec = refspec or "HEAD"
+
+    with _mirror_locks[path]:
+        if (path, refspec) in _fetched:
+            return Repo(path), _fetched[path, refspec]
+
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            Repo.init(path, bare=True)
+        repo = Repo(path)
+
+        repo.git.fetch("--depth=1", "--no-tags", url, refspec)
+        commit = repo.git.rev_parse("FETCH_HEAD^{commit}")
+        # Keep a reference to the commit so that it survives garbage collection
+        repo.git.update_ref(
+            f"refs/cookbook/{sha1(refspec.encode()).hexdigest()}", commit
+        )
+
+        _fetched[path, refspec] = commit
+        return repo, commit
+
+
+def remote_commit(url: str, refspec: Union[str, None] = None) -> Union[str, None]:
+    """
+    Get the SHA of the commit a reference points to in a remote repository.
+
+    Only asks the remote for its references, without fetching anything.
+    Returns ``None`` if the remote can't be reached or has no such reference.
+    """
+    try:
+        refs = Git().ls_remote(url, refspec or "HEAD")
+    except GitCommandError:
+        return None
+    for line in refs.splitlines():
+        sha, _, _ = line.partition("\t")
+        return sha
+    return None
+
+
+def _prefixes(paths: Mapping[str, Path]) -> List[Tuple[PurePosixPath, Path]]:
+    """Sort directories to download so nested ones are checked first"""
+    return sorted(
+        (
+            (PurePosixPath(src_path), Path(dst_path))
+            for src_path, dst_path in paths.items()
+        ),
+        key=lambda pair: len(pair[0].parts),
+        reverse=True,
+    )
+
+
+def _local_path(
+    name: PurePosixPath, prefixes: List[Tuple[PurePosixPath, Path]]
+) -> Union[Path, None]:
+    """Get where a path in the repository should be downloaded to, if anywhere"""
+    for prefix, dst_path in prefixes:
+        if prefix in name.parents:
+            return dst_path / name.relative_to(prefix)
+    return None
+
+
+def _remove_empty_dirs(path: Path, root: Path):
+    """Remove ``path`` and its parents below ``root`` for as long as they're empty"""
+    while root in path.parents:
+        try:
+            path.rmdir()
+        except OSError:
+            return
+        path = path.parent
+
+
+def _export(
+    repo: Repo,
+    commit: str,
+    src_paths: List[str],
+    prefixes: List[Tuple[PurePosixPath, Path]],
+):
+    """Extract paths in a commit to where ``prefixes`` says they should go"""
+    with TemporaryFile() as archive:
+        repo.archive(archive, commit, path=src_paths, format="tar")
+        archive.seek(0)
+        with tarfile.open(fileobj=archive) as tar:
+            for member in tar:
+                name = PurePosixPath(member.name)
+                for prefix, dst_path in prefixes:
+                    if prefix in name.parents:
+                        member.name = str(name.relative_to(prefix))
+                        tar.extract(member, dst_path, filter="data")
+                        break
+
+
+def download_paths(
+    src_repo: str,
+    paths: Mapping[str, Path],
+    refspec: Union[str, None] = None,
+    url: Union[str, None] = None,
+):
+    """
+    Download several directories from GitHub src_repo at once.
+
+    ``paths`` maps each directory in the repository to the local path its
+    contents should be downloaded to. The repository is fetched into a
+    persistent local mirror (see :func:`fetch_commit`) and all the directories
+    are exported from it together, so repeated downloads from the same
+    repository only fetch what has changed. ``url`` overrides where the
+    repository is fetched from, for instance to use a local ``file://``
+    repository.
+    """
+    if not paths:
+        return
+
+    repo, commit = fetch_commit(url or github_url(src_repo), refspec)
+
+    # Check longer prefixes first so nested directories go to the right place
+    prefixes = _prefixes(paths)
+    _export(repo, commit, [str(prefix) for prefix, _ in prefixes], prefixes)
+
+
+def sync_paths(
+    src_repo: str,
+    paths: Mapping[str, Path],
+    refspec: Union[str, None] = None,
+    url: Union[str, None] = None,
+    stamp_path: Path = CACHE_STAMP_PATH,
+):
+    """
+    Keep several directories up to date with GitHub src_repo.
+
+    Like :func:`download_paths`, but only downloads what has changed since the
+    last call. The commit that was downloaded and the git blob hash of each
+    file are recorded in ``stamp_path``. If the remote reference still points
+    to that commit, which is checked without fetching anything, nothing is
+    downloaded. Otherwise, the commit is fetched into the local mirror, files
+    whose blob hashes differ from the record are extracted, and recorded
+    files that are no longer in the repository are deleted.
+
+    Only directories that are missing or were recorded by a previous call are
+    touched, so directories that were written some other way are left alone.
+    If the remote can't be reached, recorded directories are left as they are.
+    """
+    url = url or github_url(src_repo)
+    try:
+        stamp = json.loads(stamp_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        stamp = {}
+    stamped_dirs = set(stamp.get("paths", {}).values())
+    stamped_files: Dict[str, str] = stamp.get("files", {})
+
+    paths = {
+        src_path: Path(dst_path)
+        for src_path, dst_path in paths.items()
+        if str(dst_path) in stamped_dirs or not Path(dst_path).exists()
+    }
+    if not paths:
+        return
+
+    up_to_date = (
+        stamp.get("source") == [url, refspec]
+        and all(str(dst_path) in stamped_dirs for dst_path in paths.values())
+        and all(os.path.lexists(path) for path in stamped_files)
+    )
+    if up_to_date:
+        head = remote_commit(url, refspec)
+        if head is None or head == stamp.get("commit"):
+            return
+
+    repo, commit = fetch_commit(url, refspec)
+    prefixes = _prefixes(paths)
+
+    # Get the blob hash of every file we want from the commit's tree
+    files: Dict[str, str] = {}
+    to_export: List[str] = []
+    entries = repo.git.ls_tree(
+        "-r", "-z", commit, "--", *(str(prefix) for prefix, _ in prefixes)
+    )
+    for entry in entries.split("\0"):
+        if not entry:
+            continue
+        info, _, name = entry.partition("\t")
+        _, object_type, sha = info.split()
+        local_path = _local_path(PurePosixPath(name), prefixes)
+        if object_type != "blob" or local_path is None:
+            continue
+        files[str(local_path)] = sha
+        if stamped_files.get(str(local_path)) != sha or not local_path.exists():
+            # Replace the file rather than writing through any hard links
+            local_path.unlink(missing_ok=True)
+            to_export.append(f":(literal){name}")
+
+    # Delete files that have been removed from the repository
+    for path in stamped_files:
+        root = next((dst for _, dst in prefixes if dst in Path(path).parents), None)
+        if path in files or root is None:
+            continue
+        Path(path).unlink(missing_ok=True)
+        _remove_empty_dirs(Path(path).parent, root)
+
+    if to_export:
+        _export(repo, commit, to_export, prefixes)
+
+    stamp_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = stamp_path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_text(
+        json.dumps(
+            {
+                "source": [url, refspec],
+                "commit": commit,
+                "paths": {src: str(dst) for src, dst in paths.items()},
+                "files": files,
+            }
+        )
+    )
+    tmp_path.replace(stamp_path)
 
 
 def download_dir(
@@ -18,41 +274,84 @@ def download_dir(
     src_path: str,
     dst_path: Path,
     refspec: Union[str, None] = None,
+    url: Union[str, None] = None,
 ):
-    """Download the contents of src_path from GitHub src_repo to dst_path."""
-    with TemporaryDirectory() as local_repo_path:
-        # Clone without downloading anything
-        repo = Repo.clone_from(
-            url=f"https://github.com/{src_repo}.git",
-            to_path=local_repo_path,
-            multi_options=[
-                "--depth=1",
-                "--sparse",
-                "--no-checkout",
-                f"--branch={refspec}",
-            ],
-        )
-        # Just checkout the requested directory
-        repo.git.sparse_checkout("set", src_path)
-        repo.git.checkout()
+    """
+    Download the contents of src_path from GitHub src_repo to dst_path.
 
-        # Move the requested directory to dst_path
-        shutil.move(Path(local_repo_path) / src_path, dst_path)
+    See :func:`download_paths`.
+    """
+    download_paths(src_repo, {src_path: dst_path}, refspec=refspec, url=url)
 
 
-def get_repo_tagnames(repo: str) -> Generator[str, None, None]:
-    """Get a list of tagnames in a GitHub repository"""
-    r = requests.get(
-        f"https://api.github.com/repos/{repo}/tags",
-        params={"per_page": "100"},
-    )
-    r.raise_for_status()
-    yield from (tag["name"] for tag in r.json())
+def github_session() -> requests.Session:
+    """
+    Get this thread's session for the GitHub API.
+
+    Reusing a session reuses its connections. If the ``GITHUB_TOKEN``
+    environment variable is set, it is used to authenticate.
+    """
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.headers["Accept"] = "application/vnd.github+json"
+        if token := os.environ.get("GITHUB_TOKEN"):
+            session.headers["Authorization"] = f"Bearer {token}"
+        _sessions.session = session
+    return session
+
+
+def get_repo_tagnames(
+    repo: str,
+    api_url: str = GITHUB_API_URL,
+    cache_root: Path = TAG_CACHE_ROOT,
+) -> Generator[str, None, None]:
+    """
+    Get a list of tagnames in a GitHub repository
 
-    while "next" in r.links:
-        r = requests.get(r.links["next"]["url"])
-        r.raise_for_status()
-        yield from (tag["name"] for tag in r.json())
+    Tags are yielded a page at a time, so consumers that stop early don't
+    request later pages. Each page is cached on disk in ``cache_root`` with
+    its ETag, and revalidated with a conditional request; unchanged pages
+    don't count against GitHub's rate limit.
+    """
+    cache_path = cache_root / (repo.replace("/", "__") + ".json")
+    try:
+        cache = json.loads(cache_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        cache = {}
+    updated = False
+
+    url = f"{api_url}/repos/{repo}/tags?per_page=100"
+    try:
+        while url is not None:
+            cached_page = cache.get(url)
+            headers = {"If-None-Match": cached_page["etag"]} if cached_page else {}
+            r = github_session().get(url, headers=headers)
+
+            if r.status_code == 304 and cached_page:
+                tags = cached_page["tags"]
+                next_url = cached_page["next"]
+            else:
+                r.raise_for_status()
+                tags = [tag["name"] for tag in r.json()]
+                next_url = r.links.get("next", {}).get("url")
+                if "ETag" in r.headers:
+                    cache[url] = {
+                        "etag": r.headers["ETag"],
+                        "tags": tags,
+                        "next": next_url,
+                    }
+                    updated = True
+
+            yield from tags
+            url = next_url
+    finally:
+        # Runs even if the consumer stops early
+        if updated:
+            cache_root.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(cache))
+            tmp_path.replace(cache_path)
 
 
 def get_stable_tagname(repo: str) -> str:
@@ -97,20 +396,19 @@ def get_tag_matching_installed_version(repo: str) -> str:
     except Exception:
         raise ValueError(f"Error encountered while getting version for repo {repo}")
 
-    # Find a matching tag
-    tagnames = [*get_repo_tagnames(repo)]
-    if version in tagnames:
-        matching_tag = version
-    else:
-        matching_tag = next_or_none(
-            filter(
-                lambda tag: tagname_matches_version(tag, version),
-                tagnames,
-            )
-        )
+    # Find a matching tag, preferring one that is exactly the version. Stop as
+    # soon as we see that, but otherwise remember the first loose match
+    tagnames = []
+    loose_match = None
+    for tagname in get_repo_tagnames(repo):
+        if tagname == version:
+            return tagname
+        if loose_match is None and tagname_matches_version(tagname, version):
+            loose_match = tagname
+        tagnames.append(tagname)
+    if loose_match is not None:
+        return loose_match
 
-    if matching_tag is None:
-        raise ValueError(
-            f"Could not find tag for version {version} of repo {repo}; found tags {tagnames}"
-        )
-    return matching_tag
+    raise ValueError(
+        f"Could not find tag for version {version} of repo {repo}; found tags {tagnames}"
+    )
@@ -48,6 +48,15 @@ DO_NOT_SEARCH = [
 ]
 """Directory names to not descend into when searching for notebooks."""
 
+NOTEBOOK_SEARCH_PRUNE: Final = [*DO_NOT_SEARCH, *IGNORED_FILES, ".*"]
+"""
+Patterns of file and directory names to skip when searching for notebooks.
+
+Patterns are matched against each name with ``fnmatch``. Hidden directories
+like ``.git`` and ``.ipynb_checkpoints`` are skipped, as are the names in
+``DO_NOT_SEARCH`` and ``IGNORED_FILES``.
+"""
+
 SRC_IPYNB_ROOT: Final[Path] = OPENFF_DOCS_ROOT / "build/cookbook/src"
 """
 Path to download notebooks to and cache unmodified notebooks in.
@@ -67,6 +76,203 @@ DOWNLOAD_IPYNB_ROOT: Final[Path] = OPENFF_DOCS_ROOT / "source/_cookbook/download
 Path to store zips of notebooks and their required files.
 """
 
+ARCHIVE_FORMATS: Final = {
+    "gz": ".tgz",
+    "pigz": ".tgz",
+    "zstd": ".tar.zst",
+    "zip": ".zip",
+}
+"""
+Formats available for download archives, and the suffix of each.
+
+``"gz"`` and ``"pigz"`` both write gzipped tarballs; ``"pigz"`` compresses with
+the multi-threaded ``pigz`` executable rather than in Python. ``"zstd"`` needs
+the ``zstd`` executable.
+"""
+
+DEFAULT_ARCHIVE_FORMAT: Final = "gz"
+"""Format of download archives, unless another is requested."""
+
+ARCHIVE_MTIME: Final = 315532800
+"""
+Modification time of every file in reproducible download archives.
+
+In seconds since the Unix epoch; this is 1980-01-01, the earliest time a zip
+file can represent. ``SOURCE_DATE_EPOCH`` takes precedence if it is set.
+"""
+
+GIT_CACHE_ROOT: Final[Path] = OPENFF_DOCS_ROOT / "build/cookbook/git"
+"""
+Path to store local mirrors of the git repositories that notebooks come from.
+"""
+
+CACHE_STAMP_PATH: Final[Path] = OPENFF_DOCS_ROOT / "build/cookbook/cache_stamp.json"
+"""
+Path to the record of what the Sphinx extension last downloaded from the cache.
+
+Records the commit of the cache branch that was downloaded and the git blob
+hash of each file, so that later builds only download the files that have
+changed. Directories that aren't recorded here, such as those written by
+``proc_examples.py``, are never overwritten by the cache.
+"""
+
+GITHUB_API_URL: Final = "https://api.github.com"
+"""Root URL of the GitHub REST API."""
+
+TAG_CACHE_ROOT: Final[Path] = OPENFF_DOCS_ROOT / "build/cookbook/tags"
+"""
+Path to cache responses from the GitHub API listing repositories' tags.
+"""
+
+EXEC_CACHE_ROOT: Final[Path] = OPENFF_DOCS_ROOT / "build/cookbook/exec_cache"
+"""
+Path to store executed notebooks, keyed by a hash of everything they depend on.
+"""
+
+EXEC_CACHE_MAX_BYTES: Final = 2 * 1024**3
+"""
+Maximum total size of the execution cache in bytes.
+
+Least recently used entries are evicted first when the cache grows beyond this.
+"""
+
+EXEC_CACHE_MAX_AGE: Final = 30 * 24 * 60 * 60
+"""Age in seconds after which unused execution cache entries are evicted."""
+
+BLOB_STORE_ROOT: Final[Path] = OPENFF_DOCS_ROOT / "build/cookbook/blobs"
+"""
+Path to store the files and compressed archive members shared between notebooks.
+
+Colab folders are built from hard links into this store, and download archives
+are assembled from compressed members cached here, so files shared by many
+notebooks are only stored and compressed once.
+"""
+
+BLOB_STORE_MAX_AGE: Final = 30 * 24 * 60 * 60
+"""Age in seconds after which unused compressed archive members are evicted."""
+
+MANIFEST_PATH: Final[Path] = OPENFF_DOCS_ROOT / "build/cookbook/manifest.json"
+"""
+Path to the record of each processed notebook's inputs and outputs.
+
+Used by ``proc_examples.py --incremental`` to skip notebooks that haven't
+changed since the last run.
+"""
+
+RUNTIMES_PATH: Final[Path] = OPENFF_DOCS_ROOT / "build/cookbook/runtimes.json"
+"""
+Path to the record of how long each notebook took to execute.
+
+Used to execute the slowest notebooks first.
+"""
+
+OUTPUTS_DIR_NAME: Final = "_outputs"
+"""
+Name of the directory of large outputs moved out of executed notebooks.
+
+There is one such directory for each source repository, in the repository's
+directory in ``EXEC_IPYNB_ROOT``.
+"""
+
+EXTERNALIZED_MIME_TYPES: Final = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "application/pdf": ".pdf",
+}
+"""Base64-encoded output types that may be moved out of notebooks, with suffixes."""
+
+OUTPUT_BINARY_MAX_BYTES: Final[int | None] = 256 * 1024
+"""
+Size in bytes above which a binary output is moved out of its notebook.
+
+``None`` keeps every output in its notebook.
+"""
+
+OUTPUT_TEXT_MAX_CHARS: Final[int | None] = 100_000
+"""
+Length above which a text output has its middle cut out.
+
+``None`` keeps text outputs whole.
+"""
+
+WIDGET_STATE_MAX_BYTES: Final[int | None] = None
+"""
+Size in bytes above which a notebook's widget state is dropped.
+
+``None`` keeps widget state whatever its size, since interactive widgets like
+NGLView views are one of the main attractions of some notebooks.
+"""
+
+NOTEBOOK_MAX_BYTES: Final[int | None] = 10 * 1024**2
+"""
+Size in bytes of an executed notebook above which it is reported as too big.
+
+Applies after large outputs have been moved out of the notebook.
+"""
+
+KERNEL_NAME: Final = "python3"
+"""Name of the Jupyter kernel used to execute notebooks."""
+
+ENV_CACHE_ROOT: Final[Path] = OPENFF_DOCS_ROOT / "build/cookbook/envs"
+"""
+Path to store the Conda environments that notebooks packaging their own are run in.
+
+Each environment is named for a hash of its environment file, so notebooks with
+the same environment share it. Used by ``proc_examples.py --notebook-envs``.
+"""
+
+ENV_KERNELS_ROOT: Final[Path] = OPENFF_DOCS_ROOT / "build/cookbook/jupyter"
+"""
+Path to register the Jupyter kernels for the environments in ``ENV_CACHE_ROOT``.
+
+``proc_examples.py`` adds this to ``JUPYTER_PATH`` so that the kernels are found.
+"""
+
+CONDA_EXECUTABLES: Final = ["micromamba", "mamba", "conda"]
+"""Programs to create environments with, in order of preference."""
+
+DEFAULT_NOTEBOOK_THREADS: Final = 1
+"""
+Threads a notebook may use, unless it declares otherwise.
+
+Notebooks declare the resources they need in the ``cookbook_resources`` key of
+their metadata, for example ``{"threads": 4, "memory_gib": 8}``.
+"""
+
+DEFAULT_NOTEBOOK_MEMORY_GIB: Final = 1.0
+"""Memory in GiB a notebook is expected to use, unless it declares otherwise."""
+
+THREAD_ENV_VARS: Final = [
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "OPENMM_CPU_THREADS",
+]
+"""
+Environment variables set to the number of threads each kernel may use.
+
+These cover OpenMP (and so PyTorch, which NAGL uses), the common BLAS
+libraries, NumExpr and OpenMM's CPU platform.
+"""
+
+KERNEL_WARMUP_MODULES: Final = [
+    "numpy",
+    "openmm",
+    "rdkit.Chem",
+    "openff.units",
+    "openff.toolkit",
+    "openff.interchange",
+]
+"""
+Modules imported ahead of time by warm kernels.
+
+Used by ``proc_examples.py --engine=warm``. Modules are imported without adding
+any names to the kernel's namespace, and any that fail to import are skipped.
+"""
+
 THUMBNAIL_FILENAME = "thumbnail.png"
 """
 Filename for a notebook's thumbnail.
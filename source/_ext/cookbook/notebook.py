@@ -1,34 +1,36 @@
 """Code for working with notebooks in both the Sphinx extension and proc_examples.py"""
-from typing import Any, List, Optional, Generator
+from typing import Any, List, Optional, Tuple
 from uuid import uuid4
 from copy import deepcopy
 from pathlib import Path
 from hashlib import sha1
+from collections import deque
+from fnmatch import translate
+from functools import lru_cache
+import os
+import re
 
 from .globals_ import (
     EXEC_IPYNB_ROOT,
     DOWNLOAD_IPYNB_ROOT,
     COLAB_IPYNB_ROOT,
-    DO_NOT_SEARCH,
+    NOTEBOOK_SEARCH_PRUNE,
     SRC_IPYNB_ROOT,
+    ARCHIVE_FORMATS,
+    DEFAULT_ARCHIVE_FORMAT,
 )
 
 
-def insert_cell(
-    notebook: dict,
+def new_cell(
     cell_type: str = "code",
-    position: int = 0,
     source: Optional[List[str]] = None,
     metadata: Optional[dict] = None,
     outputs: Optional[List[str]] = None,
 ) -> dict:
-    """Insert a cell created from the arguments into a new copy of the notebook
+    """Create a cell from the arguments, ready to be inserted into a notebook
 
     Args:
-        notebook: An ipython/jupyter notebook in dict form. Can be generated
-                  by parsing the notebook file as json
         cell_type: The cell type; "code", "markdown", "raw", etc
-        position: The position of the new cell in the finished notebook. See dict.insert()
         source: A list of lines of source code for the cell. Newlines are inserted at the
                 end of each line in the list
         metadata: A dictionary of metadata values. Should be encodable as json.
@@ -36,14 +38,13 @@ def insert_cell(
                 end of each line in the list
 
     Returns:
-        dict: A copy of the input notebook with the cell inserted.
+        dict: The new cell.
     """
     source = [] if source is None else "\n".join(source).splitlines(keepends=True)
     outputs = [] if outputs is None else "\n".join(outputs).splitlines(keepends=True)
     metadata = {} if metadata is None else metadata
-    notebook = deepcopy(notebook)
 
-    cell = {
+    return {
         "cell_type": cell_type,
         "execution_count": 0,
         "id": str(uuid4()),
@@ -52,10 +53,69 @@ def insert_cell(
         "source": source,
     }
 
-    notebook.setdefault("cells", []).insert(position, cell)
+
+def insert_cells(
+    notebook: dict,
+    cells: List[dict],
+    position: int = 0,
+    inplace: bool = False,
+) -> dict:
+    """Insert some cells into a notebook, all at once
+
+    Args:
+        notebook: An ipython/jupyter notebook in dict form. Can be generated
+                  by parsing the notebook file as json
+        cells: The cells to insert, in order. See new_cell()
+        position: The position of the first new cell in the finished notebook.
+                  See list.insert()
+        inplace: If True, modify and return the input notebook rather than a
+                 copy. This avoids copying large outputs.
+
+    Returns:
+        dict: The notebook with the cells inserted.
+    """
+    if not inplace:
+        notebook = deepcopy(notebook)
+
+    notebook_cells = notebook.setdefault("cells", [])
+    # Slice assignment doesn't support negative positions the way insert does
+    if position < 0:
+        position = max(len(notebook_cells) + position, 0)
+    notebook_cells[position:position] = cells
     return notebook
 
 
+def insert_cell(
+    notebook: dict,
+    cell_type: str = "code",
+    position: int = 0,
+    source: Optional[List[str]] = None,
+    metadata: Optional[dict] = None,
+    outputs: Optional[List[str]] = None,
+    inplace: bool = False,
+) -> dict:
+    """Insert a cell created from the arguments into a new copy of the notebook
+
+    Args:
+        notebook: An ipython/jupyter notebook in dict form. Can be generated
+                  by parsing the notebook file as json
+        cell_type: The cell type; "code", "markdown", "raw", etc
+        position: The position of the new cell in the finished notebook. See dict.insert()
+        source: A list of lines of source code for the cell. Newlines are inserted at the
+                end of each line in the list
+        metadata: A dictionary of metadata values. Should be encodable as json.
+        output: A list of lines of text output for the cell. Newlines are inserted at the
+                end of each line in the list
+        inplace: If True, modify and return the input notebook rather than a
+                 copy. This avoids copying large outputs.
+
+    Returns:
+        dict: A copy of the input notebook with the cell inserted.
+    """
+    cell = new_cell(cell_type, source, metadata, outputs)
+    return insert_cells(notebook, [cell], position, inplace)
+
+
 def get_metadata(
     notebook: dict,
     key: str,
@@ -75,20 +135,33 @@ def is_bare_notebook(docpath: Path) -> bool:
     return docpath.parent.name in ["examples", "experimental", "deprecated"]
 
 
-def notebook_download(docpath: Path) -> Path:
-    """Get the name of the zip file for the notebook at ``docpath``"""
+def notebook_download(docpath: Path, archive_format: Optional[str] = None) -> Path:
+    """
+    Get the name of the zip file for the notebook at ``docpath``
+
+    ``archive_format`` is a key of ``ARCHIVE_FORMATS``. If it is not given,
+    the path of an existing archive in any format is returned, or failing that
+    the path for ``DEFAULT_ARCHIVE_FORMAT``.
+    """
     # Strip off any leading SRC_IPYNB_ROOT or EXEC_IPYNB_ROOT
     if str(docpath).startswith(str(SRC_IPYNB_ROOT) + "/"):
         docpath = Path(str(docpath)[len(str(SRC_IPYNB_ROOT)) + 1 :])
     if str(docpath).startswith(str(EXEC_IPYNB_ROOT) + "/"):
         docpath = Path(str(docpath)[len(str(EXEC_IPYNB_ROOT)) + 1 :])
-    # Get the zip file path
+    # Get the zip file path, without a suffix
     if is_bare_notebook(docpath):
         # Notebook has no needed files, just zip the notebook itself
-        return DOWNLOAD_IPYNB_ROOT / docpath.with_suffix(".tgz")
+        stem = DOWNLOAD_IPYNB_ROOT / docpath.with_suffix("")
     else:
         # Zip the entire containing folder
-        return DOWNLOAD_IPYNB_ROOT / docpath.parent.with_suffix(".tgz")
+        stem = DOWNLOAD_IPYNB_ROOT / docpath.parent
+    # Work out which format the archive is in
+    if archive_format is None:
+        for suffix in ARCHIVE_FORMATS.values():
+            if stem.with_name(stem.name + suffix).exists():
+                return stem.with_name(stem.name + suffix)
+        archive_format = DEFAULT_ARCHIVE_FORMAT
+    return stem.with_name(stem.name + ARCHIVE_FORMATS[archive_format])
 
 
 def notebook_colab(docpath: Path) -> Path:
@@ -117,14 +190,34 @@ def notebook_colab(docpath: Path) -> Path:
         return COLAB_IPYNB_ROOT / docpath
 
 
-def find_notebooks(path: Path) -> Generator[Path, None, None]:
-    """Descend through a file tree and yield all the notebooks inside"""
-    index = [*path.iterdir()]
-    while index:
-        item = index.pop(0)
+@lru_cache(maxsize=None)
+def find_notebooks(
+    path: Path,
+    prune: Tuple[str, ...] = (*NOTEBOOK_SEARCH_PRUNE,),
+) -> Tuple[Path, ...]:
+    """
+    Descend through a file tree and find all the notebooks inside
+
+    The tree is searched breadth first, and each directory in order of name.
+    Files and directories with names matching any of the ``fnmatch`` patterns
+    in ``prune`` are skipped without being looked inside.
 
-        if item.is_dir() and item.name not in DO_NOT_SEARCH:
-            index.extend([subitem for subitem in item.iterdir()])
-        else:
-            if item.suffix.lower() == ".ipynb":
-                yield item
+    Results are cached for each ``path`` and ``prune``, so repeated searches
+    are free. Call ``find_notebooks.cache_clear()`` after changing the tree.
+    """
+    pruned = re.compile("|".join(map(translate, prune)) if prune else "(?!)")
+
+    notebooks: List[Path] = []
+    queue = deque([path])
+    while queue:
+        # DirEntry caches the type of each entry, so checking it is free
+        with os.scandir(queue.popleft()) as entries:
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                if pruned.match(entry.name):
+                    continue
+                if entry.is_dir():
+                    queue.append(Path(entry.path))
+                elif entry.name.lower().endswith(".ipynb"):
+                    notebooks.append(Path(entry.path))
+
+    return tuple(notebooks)
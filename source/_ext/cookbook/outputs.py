@@ -0,0 +1,147 @@
+"""Keep the outputs of executed notebooks within a size budget for proc_examples.py"""
+
+import base64
+import json
+import os
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Any, Dict, Optional
+
+from .globals_ import (
+    EXTERNALIZED_MIME_TYPES,
+    OUTPUT_BINARY_MAX_BYTES,
+    OUTPUT_TEXT_MAX_CHARS,
+    WIDGET_STATE_MAX_BYTES,
+    NOTEBOOK_MAX_BYTES,
+)
+
+WIDGET_STATE_MIME_TYPE = "application/vnd.jupyter.widget-state+json"
+"""Key of the widget state in a notebook's ``widgets`` metadata."""
+
+WIDGET_VIEW_MIME_TYPE = "application/vnd.jupyter.widget-view+json"
+"""MIME type of outputs that display a widget from the widget state."""
+
+
+def _join(text: Any) -> str:
+    """Join text that may be split into lines, as it is in notebook JSON"""
+    return text if isinstance(text, str) else "".join(text)
+
+
+def externalize(data: bytes, outputs_dir: Path, suffix: str) -> Path:
+    """
+    Write some data to a file in ``outputs_dir`` named for its hash.
+
+    Identical outputs from different notebooks share a single file. Returns
+    the path to the file.
+    """
+    path = outputs_dir / f"{sha256(data).hexdigest()[:32]}{suffix}"
+    if not path.exists():
+        outputs_dir.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile(dir=outputs_dir, suffix=".tmp", delete=False) as tmp:
+            tmp.write(data)
+        os.chmod(tmp.name, 0o644)
+        os.replace(tmp.name, path)
+    return path
+
+
+def truncate_text(text: str, max_chars: int) -> str:
+    """Cut the middle out of ``text`` if it is longer than ``max_chars``"""
+    if len(text) <= max_chars:
+        return text
+    head = text[: max_chars // 2]
+    tail = text[len(text) - max_chars // 2 :]
+    return (
+        f"{head}\n\n... {len(text) - len(head) - len(tail)} characters truncated"
+        + f" ...\n\n{tail}"
+    )
+
+
+def apply_output_budget(
+    nb: Dict[str, Any],
+    notebook_dir: Path,
+    outputs_dir: Path,
+    binary_max_bytes: Optional[int] = OUTPUT_BINARY_MAX_BYTES,
+    text_max_chars: Optional[int] = OUTPUT_TEXT_MAX_CHARS,
+    widget_state_max_bytes: Optional[int] = WIDGET_STATE_MAX_BYTES,
+    notebook_max_bytes: Optional[int] = NOTEBOOK_MAX_BYTES,
+) -> Dict[str, Any]:
+    """
+    Shrink the outputs of an executed notebook in place.
+
+    Binary outputs of the types in ``EXTERNALIZED_MIME_TYPES`` that are larger
+    than ``binary_max_bytes`` are moved into content-addressed files in
+    ``outputs_dir``, and replaced with a Markdown output that embeds or links
+    to the file relative to ``notebook_dir``, where the notebook is written.
+    Stream and plain text outputs longer than ``text_max_chars`` have their
+    middle cut out. Widget state larger than ``widget_state_max_bytes`` is
+    dropped, along with the outputs that display widgets, so that they fall
+    back to their static representations. Any limit may be ``None`` to
+    disable it.
+
+    Returns a JSON-serializable report of what was done, with the size of the
+    notebook afterwards in ``"bytes"`` and whether that exceeds
+    ``notebook_max_bytes`` in ``"over_budget"``. The paths of the files the
+    notebook's outputs were moved to are listed in ``"externalized_files"``.
+    """
+    report: Dict[str, Any] = {
+        "externalized": 0,
+        "externalized_files": [],
+        "truncated": 0,
+        "widget_state_dropped": False,
+    }
+
+    widgets = nb.get("metadata", {}).get("widgets", {})
+    if widget_state_max_bytes is not None and WIDGET_STATE_MIME_TYPE in widgets:
+        state_size = len(json.dumps(widgets[WIDGET_STATE_MIME_TYPE]))
+        if state_size > widget_state_max_bytes:
+            del widgets[WIDGET_STATE_MIME_TYPE]
+            report["widget_state_dropped"] = True
+
+    for cell in nb.get("cells", []):
+        for output in cell.get("outputs", []):
+            # Widgets can't be displayed without their state
+            if report["widget_state_dropped"]:
+                output.get("data", {}).pop(WIDGET_VIEW_MIME_TYPE, None)
+
+            # Output text is either in a stream or in a rich output's data
+            if text_max_chars is not None and "text" in output:
+                text = _join(output["text"])
+                if len(text) > text_max_chars:
+                    output["text"] = truncate_text(text, text_max_chars)
+                    report["truncated"] += 1
+
+            data = output.get("data", {})
+            if text_max_chars is not None and "text/plain" in data:
+                text = _join(data["text/plain"])
+                if len(text) > text_max_chars:
+                    data["text/plain"] = truncate_text(text, text_max_chars)
+                    report["truncated"] += 1
+
+            if binary_max_bytes is None:
+                continue
+            for mime_type, suffix in EXTERNALIZED_MIME_TYPES.items():
+                if mime_type not in data:
+                    continue
+                binary = base64.b64decode(_join(data[mime_type]))
+                if len(binary) <= binary_max_bytes:
+                    continue
+
+                path = externalize(binary, outputs_dir, suffix)
+                uri = Path(os.path.relpath(path, notebook_dir)).as_posix()
+                del data[mime_type]
+                # Markdown outputs are rendered ahead of plain text
+                if mime_type.startswith("image/"):
+                    data["text/markdown"] = f"![output]({uri})"
+                else:
+                    data["text/markdown"] = f"[Download output]({uri})"
+                output.get("metadata", {}).pop(mime_type, None)
+                report["externalized"] += 1
+                if str(path) not in report["externalized_files"]:
+                    report["externalized_files"].append(str(path))
+
+    report["bytes"] = len(json.dumps(nb))
+    report["over_budget"] = (
+        notebook_max_bytes is not None and report["bytes"] > notebook_max_bytes
+    )
+    return report
@@ -0,0 +1,146 @@
+"""Pack executing notebooks onto the machine's cores and memory for proc_examples.py"""
+
+import os
+import queue
+from collections import deque
+from multiprocessing.pool import Pool
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+from .globals_ import (
+    DEFAULT_NOTEBOOK_THREADS,
+    DEFAULT_NOTEBOOK_MEMORY_GIB,
+    THREAD_ENV_VARS,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+Request = Tuple[int, int]
+"""Threads and bytes of memory needed by a notebook."""
+
+
+def machine_resources() -> Request:
+    """Get the number of cores available to this process and the total memory"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    try:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        # Don't limit memory if we can't tell how much there is
+        memory = 2**63
+    return cores, memory
+
+
+def notebook_resources(nb: Dict[str, Any], cores: Optional[int] = None) -> Request:
+    """
+    Get the threads and memory a notebook declares it needs.
+
+    These are read from the ``"cookbook_resources"`` key of the notebook's
+    metadata, which may specify ``"threads"`` and ``"memory_gib"``. Missing
+    values default to ``DEFAULT_NOTEBOOK_THREADS`` and
+    ``DEFAULT_NOTEBOOK_MEMORY_GIB``. Threads are limited to ``cores``, which
+    should be the cores in the :class:`ResourceBudget` the notebook runs in,
+    or by default the cores available to this process.
+    """
+    hints = nb.get("metadata", {}).get("cookbook_resources", {})
+    threads = int(hints.get("threads", DEFAULT_NOTEBOOK_THREADS))
+    memory_gib = float(hints.get("memory_gib", DEFAULT_NOTEBOOK_MEMORY_GIB))
+    if cores is None:
+        cores, _ = machine_resources()
+    return min(max(threads, 1), max(cores, 1)), max(int(memory_gib * 1024**3), 0)
+
+
+def thread_env(threads: int) -> Dict[str, str]:
+    """Get the environment variables that limit a kernel to ``threads`` threads"""
+    return {var: str(threads) for var in THREAD_ENV_VARS}
+
+
+class ResourceBudget:
+    """
+    Cores and memory shared between the notebooks executing at once.
+
+    Notebooks :meth:`claim` the threads and memory they need before they start
+    and :meth:`release` them when they finish. A notebook that needs more than
+    the whole budget still runs, but only when nothing else is running, so
+    that it can't wait forever.
+    """
+
+    def __init__(self, cores: int, memory: int, slots: Optional[int] = None):
+        self.cores: int = cores
+        """Cores shared between all the notebooks."""
+        self.free_cores: int = cores
+        """Cores not claimed by any running notebook."""
+        self.free_memory: int = memory
+        """Bytes of memory not claimed by any running notebook."""
+        self.slots: Optional[int] = slots
+        """Maximum number of notebooks to run at once, or ``None`` for no limit."""
+        self.running: int = 0
+        """Number of notebooks currently holding a claim."""
+
+    def fits(self, request: Request) -> bool:
+        """Check whether a notebook needing ``request`` can start now"""
+        if self.running == 0:
+            return True
+        if self.slots is not None and self.running >= self.slots:
+            return False
+        threads, memory = request
+        return threads <= self.free_cores and memory <= self.free_memory
+
+    def claim(self, request: Request):
+        """Take the resources for a notebook that is starting"""
+        threads, memory = request
+        self.free_cores -= threads
+        self.free_memory -= memory
+        self.running += 1
+
+    def release(self, request: Request):
+        """Give back the resources of a notebook that has finished"""
+        threads, memory = request
+        self.free_cores += threads
+        self.free_memory += memory
+        self.running -= 1
+
+
+def imap_packed(
+    pool: Pool,
+    func: Callable[[T], R],
+    items: Iterable[Tuple[T, Request]],
+    budget: ResourceBudget,
+) -> Iterator[R]:
+    """
+    Like ``pool.imap_unordered``, but only run as many items as fit the budget.
+
+    ``items`` are 2-tuples of an argument for ``func`` and the resources
+    running it needs. Items are started strictly in order: whenever an item
+    finishes, waiting items are started until the next one doesn't fit the
+    budget. Smaller items never jump ahead of a big one, so big items aren't
+    left until the end. As with ``pool.imap_unordered``, an
+    exception raised by ``func`` is raised again here when its item finishes;
+    wrap ``func`` with :func:`cookbook.utils.to_result` to return exceptions
+    instead.
+    """
+    pending = deque(items)
+    finished: "queue.SimpleQueue[Tuple[Request, R, bool]]" = queue.SimpleQueue()
+
+    while pending or budget.running:
+        while pending and budget.fits(pending[0][1]):
+            item, request = pending.popleft()
+            budget.claim(request)
+            pool.apply_async(
+                func,
+                (item,),
+                callback=lambda result, request=request: finished.put(
+                    (request, result, False)
+                ),
+                error_callback=lambda exc, request=request: finished.put(
+                    (request, exc, True)
+                ),
+            )
+
+        request, result, failed = finished.get()
+        budget.release(request)
+        if failed:
+            raise result
+        yield result
@@ -11,6 +11,10 @@ from ._gallery import (
     CookbookNode,
     CookbookEntryNode,
     proc_cookbook_toctree,
+    index_gallery,
+    update_gallery_metadata,
+    purge_gallery_page,
+    merge_gallery_pages,
 )
 
 
@@ -21,6 +25,10 @@ def do_nothing(self, node):
 def setup(app: Sphinx):
     app.connect("config-inited", download_cached_notebooks)
     app.connect("env-before-read-docs", find_notebook_docnames)
+    app.connect("env-before-read-docs", index_gallery)
+    app.connect("env-purge-doc", purge_gallery_page)
+    app.connect("env-merge-info", merge_gallery_pages)
+    app.connect("env-updated", update_gallery_metadata)
     app.connect("source-read", process_notebook)
     app.connect("doctree-resolved", proc_cookbook_toctree)
     app.add_directive("cookbook", CookbookDirective)
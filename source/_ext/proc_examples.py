@@ -2,20 +2,24 @@
 
 import re
 from typing import Tuple, List, Final
-from zipfile import ZIP_DEFLATED, ZipFile
 from pathlib import Path
 import json
 import shutil
-from multiprocessing import Pool
-from time import sleep
+from multiprocessing import Pool, Lock
+from multiprocessing.util import Finalize
+from time import perf_counter
 import sys
-import tarfile
 from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import traceback
+import csv
+import asyncio
+import os
+import signal
 
 import nbformat
-from nbconvert.preprocessors.execute import ExecutePreprocessor
 import yaml
+from jupyter_core.utils import ensure_async
 from git.repo import Repo
 
 
@@ -31,8 +35,30 @@ from cookbook.notebook import (
     set_metadata,
 )
 from cookbook.github import download_dir, get_tag_matching_installed_version
+from cookbook.execution import (
+    NotebookExecutor,
+    WarmKernelPool,
+    init_kernel_start_throttle,
+)
+from cookbook.archives import write_archive
+from cookbook.blobs import link_file, prune_blobs
+from cookbook.outputs import apply_output_budget
+from cookbook.envs import build_env, env_kernel_name, kernel_packages_key
+from cookbook.scheduling import (
+    ResourceBudget,
+    imap_packed,
+    machine_resources,
+    notebook_resources,
+    thread_env,
+)
+from cookbook.cache import (
+    hash_files,
+    fetch_cached_notebook,
+    store_cached_notebook,
+    evict_cache,
+)
 from cookbook.globals_ import *
-from cookbook.utils import set_env, to_result, in_regexes
+from cookbook.utils import to_result, in_regexes
 
 
 class NotebookExceptionError(ValueError):
@@ -106,23 +132,58 @@ def needed_files(notebook_path: Path) -> List[Tuple[Path, Path]]:
     return list(files.items())
 
 
-def create_download(notebook_path: Path):
+def packaged_env_file(notebook_path: Path) -> Path | None:
+    """
+    Get the Conda environment file a notebook packages, if it has its own
+
+    Returns ``None`` for notebooks that use ``UNIVERSAL_ENV_PATH``.
     """
-    Create a tgz file with all needed files from a jupyter notebook path
+    for path, rel_path in needed_files(notebook_path):
+        if rel_path == PACKAGED_ENV_NAME and path != UNIVERSAL_ENV_PATH:
+            return path
+    return None
+
+
+def notebook_kernel(notebook_path: Path, notebook_envs: bool = False) -> str:
+    """
+    Get the name of the kernel to execute a notebook with
+
+    If ``notebook_envs`` is ``True``, notebooks that package their own Conda
+    environment are executed in that environment, as built by
+    :func:`cookbook.envs.build_env`. Otherwise, and for all other notebooks,
+    this is ``KERNEL_NAME``.
     """
-    tgz_path = notebook_download(notebook_path)
-    tgz_path.parent.mkdir(parents=True, exist_ok=True)
+    env_file = packaged_env_file(notebook_path) if notebook_envs else None
+    return KERNEL_NAME if env_file is None else env_kernel_name(env_file)
 
-    with tarfile.open(
-        name=tgz_path,
-        mode="w:gz",
-    ) as tgz_file:
-        for path, arcname in needed_files(notebook_path):
-            tgz_file.add(path, arcname=arcname)
 
-        # Also include the run_notebook.sh script
-        path = Path(__file__).parent / "run_notebook.sh"
-        tgz_file.add(path, arcname=path.name)
+def create_download(
+    notebook_path: Path,
+    archive_format: str = DEFAULT_ARCHIVE_FORMAT,
+    level: int | None = None,
+    reproducible: bool = True,
+):
+    """
+    Create an archive with all needed files from a jupyter notebook path
+
+    ``archive_format`` is a key of ``ARCHIVE_FORMATS``, and ``level`` is the
+    compression level, or ``None`` for the format's default. If
+    ``reproducible`` is ``True``, an unchanged notebook always produces a
+    byte-identical archive.
+    """
+    archive_path = notebook_download(notebook_path, archive_format)
+    archive_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Also include the run_notebook.sh script
+    script_path = Path(__file__).parent / "run_notebook.sh"
+
+    write_archive(
+        archive_path,
+        [*needed_files(notebook_path), (script_path, Path(script_path.name))],
+        archive_format,
+        level,
+        reproducible,
+    )
 
 
 def create_colab_notebook(src: Path, cache_branch: str):
@@ -138,12 +199,12 @@ def create_colab_notebook(src: Path, cache_branch: str):
     dst = notebook_colab(src)
     dst.parent.mkdir(parents=True, exist_ok=True)
 
-    # Copy over all the files Colab will need
+    # Link in all the files Colab will need from the blob store
     for path, rel_path in files:
         if path.is_dir():
-            shutil.copytree(path, dst.parent / rel_path)
+            shutil.copytree(path, dst.parent / rel_path, copy_function=link_file)
         else:
-            shutil.copy2(path, dst.parent / rel_path)
+            link_file(path, dst.parent / rel_path)
 
     # Get the base URI to download files from the cache
     base_uri = (
@@ -160,6 +221,7 @@ def create_colab_notebook(src: Path, cache_branch: str):
     # Add a cell that installs the notebook's dependencies
     notebook = insert_cell(
         notebook,
+        inplace=True,
         cell_type="code",
         source=[
             "# Execute this cell to make this notebook's dependencies available",
@@ -175,50 +237,229 @@ def create_colab_notebook(src: Path, cache_branch: str):
 
     # Make sure the environment file doesn't include a name, as this seems to
     # break condacolab
-    with open(dst.parent / PACKAGED_ENV_NAME, "r+") as env_file:
+    env_path = dst.parent / PACKAGED_ENV_NAME
+    with open(env_path) as env_file:
         env_yaml = yaml.safe_load(env_file)
-        if "name" in env_yaml:
-            del env_yaml["name"]
-            env_file.seek(0)
+    if "name" in env_yaml:
+        del env_yaml["name"]
+        # The file is linked into the blob store, so replace rather than edit it
+        env_path.unlink()
+        with open(env_path, "w") as env_file:
             yaml.dump(env_yaml, env_file)
-            env_file.truncate()
 
-    # Write the file
+    # Write the file, replacing the link to the original notebook
+    dst.unlink(missing_ok=True)
     with open(dst, "w") as file:
         json.dump(notebook, file)
 
 
-def execute_notebook(
-    src_and_tag: Tuple[Path, str],
+def process_notebook(
+    src: Path,
     cache_branch: str,
+    archive_format: str = DEFAULT_ARCHIVE_FORMAT,
+    archive_level: int | None = None,
+    reproducible_archive: bool = True,
+) -> str:
+    """
+    Create the Colab and downloadable versions of a notebook.
+
+    Returns the path to the notebook relative to ``SRC_IPYNB_ROOT``. Any
+    exception is wrapped in a ``NotebookExceptionError`` so that the notebook
+    responsible can be reported.
+    """
+    src_rel = str(src.relative_to(SRC_IPYNB_ROOT))
+    try:
+        create_colab_notebook(src, cache_branch)
+        create_download(src, archive_format, archive_level, reproducible_archive)
+    except Exception as e:
+        raise NotebookExceptionError(src_rel, e)
+    return src_rel
+
+
+def process_notebooks(
+    srcs: List[Path],
+    cache_branch: str,
+    archive_format: str = DEFAULT_ARCHIVE_FORMAT,
+    archive_level: int | None = None,
+    reproducible_archive: bool = True,
+) -> List[str | NotebookExceptionError]:
+    """
+    Process notebooks that share a Colab folder and download archive.
+
+    The notebooks are processed one after the other, so they don't write the
+    same files at once. Returns the result of :func:`process_notebook` for
+    each notebook, with exceptions in place of the notebooks that failed.
+    """
+    return [
+        to_result(process_notebook, NotebookExceptionError)(
+            src, cache_branch, archive_format, archive_level, reproducible_archive
+        )
+        for src in srcs
+    ]
+
+
+PROC_POOLS: Final = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+"""
+Executors available for creating Colab and downloadable notebooks.
+
+Processing a notebook is mostly copying files and compressing archives, which
+release the GIL, so ``"thread"`` is usually enough; ``"process"`` sidesteps the
+GIL entirely at the cost of starting worker processes.
+"""
+
+
+ENGINES: Final = ["pool", "warm", "async"]
+"""
+Engines available for executing notebooks.
+
+``"pool"`` executes each notebook in a freshly started kernel in a pool of
+worker processes. ``"warm"`` is the same, except each worker keeps a kernel
+started and warmed up with ``KERNEL_WARMUP_MODULES`` ready for its next
+notebook. ``"async"`` drives all the kernels concurrently from this process
+with asyncio, rather than needing a worker process for each kernel.
+"""
+
+_warm_kernels: WarmKernelPool | None = None
+"""This worker's warm kernels, if the ``"warm"`` engine is in use."""
+
+
+def init_worker(kernel_start_lock, kernel_start_delay: float, warm_kernels: bool):
+    """Initialize a worker process for executing notebooks"""
+    global _warm_kernels
+    init_kernel_start_throttle(kernel_start_lock, kernel_start_delay)
+    if warm_kernels:
+        _warm_kernels = WarmKernelPool(KERNEL_WARMUP_MODULES)
+        # Pool workers exit without running atexit handlers
+        Finalize(_warm_kernels, _warm_kernels.shutdown, exitpriority=10)
+
+
+def execution_cache_key(src: Path, tag: str, kernel_name: str = KERNEL_NAME) -> str:
+    """
+    Get the key for the executed notebook in the execution cache.
+
+    The key covers the notebook itself, all the files it needs (including its
+    Conda environment), the source repository tag, the kernel, and the
+    packages installed in the kernel's environment.
+    """
+    return hash_files(
+        [(src, Path(src.name)), *needed_files(src)],
+        tag,
+        kernel_name,
+        kernel_packages_key(kernel_name),
+    )
+
+
+def report_profile(
+    nb: nbformat.NotebookNode,
+    src_rel: Path,
+    executor: NotebookExecutor,
 ):
-    """Execute a notebook and retain its widget state"""
-    # Unpack the argument
-    src, tag = src_and_tag
+    """Store an executed notebook's profile in its metadata and summarize it"""
+    profile = executor.profile()
+    set_metadata(nb, "cookbook_profile", profile)
+
+    peak_rss = profile["peak_rss"]
+    print(
+        f"Executed {src_rel} in {profile['wall_time']:.1f} s;",
+        f"kernel started in {profile['kernel_start_time']:.1f} s",
+        f"after waiting {profile['kernel_wait_time']:.1f} s for other kernels;",
+        "peak RSS",
+        "unknown" if peak_rss is None else f"{peak_rss / 1024**2:.0f} MiB",
+    )
 
-    # Get the source
+
+def write_profile_report(path: Path, results: List[dict]):
+    """
+    Write the profiles of executed notebooks to ``path``.
+
+    If ``path`` ends in ``.csv``, a table with one row per notebook is
+    written, with the slowest cell in place of each cell's time. Otherwise,
+    the full profiles are written as JSON.
+    """
+    print(f"Writing profile report to {path.absolute()}")
+    if path.suffix.lower() != ".csv":
+        path.write_text(json.dumps(results, indent=1))
+        return
+
+    columns = [
+        "src",
+        "cached",
+        "duration",
+        "wall_time",
+        "kernel_start_time",
+        "kernel_wait_time",
+        "time_to_first_cell",
+        "peak_rss",
+        "slowest_cell",
+        "slowest_cell_time",
+    ]
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        for result in results:
+            profile = result["profile"] or {}
+            cell_times = {
+                index: time
+                for index, time in profile.get("cell_times", {}).items()
+                if time is not None
+            }
+            slowest_cell = max(cell_times, key=cell_times.__getitem__, default=None)
+            writer.writerow(
+                {
+                    **{column: profile.get(column) for column in columns},
+                    "src": result["src"],
+                    "cached": result["cached"],
+                    "duration": result["duration"],
+                    "slowest_cell": slowest_cell,
+                    "slowest_cell_time": cell_times.get(slowest_cell),
+                }
+            )
+
+
+def load_notebook(
+    src: Path,
+    tag: str,
+    use_cache: bool,
+    kernel_name: str = KERNEL_NAME,
+) -> Tuple[nbformat.NotebookNode, str | None, bool]:
+    """
+    Load a notebook for execution.
+
+    Returns the notebook, its key in the execution cache (or ``None`` if
+    ``use_cache`` is ``False``), and whether the notebook was restored already
+    executed from the cache.
+    """
     src_rel = src.relative_to(SRC_IPYNB_ROOT)
-    print("Executing", src_rel)
 
+    cache_key = execution_cache_key(src, tag, kernel_name) if use_cache else None
+    cached_path = None if cache_key is None else fetch_cached_notebook(cache_key)
+
+    if cached_path is not None:
+        print("Restoring", src_rel, "from execution cache")
+        with open(cached_path, "r") as f:
+            return nbformat.read(f, nbformat.NO_CONVERT), cache_key, True
+
+    print("Executing", src_rel)
     with open(src, "r") as f:
-        nb = nbformat.read(f, nbformat.NO_CONVERT)
+        return nbformat.read(f, nbformat.NO_CONVERT), cache_key, False
 
-    # TODO: See if we can convince this to do each notebook single-threaded?
-    with set_env(
-        OPENMM_CPU_THREADS="1",
-    ):
-        executor = ExecutePreprocessor(
-            kernel_name="python3",
-            timeout=1200,
-        )
-        executor.store_widget_state = True
-        # Execute the notebook
-        # TODO: Run in the notebook-specific Conda environment?
-        try:
-            executor.preprocess(nb, {"metadata": {"path": src.parent}})
-        except Exception as e:
-            print("Failed to execute", src.relative_to(SRC_IPYNB_ROOT))
-            raise NotebookExceptionError(str(src_rel), e)
+
+def save_executed_notebook(
+    nb: nbformat.NotebookNode,
+    src: Path,
+    tag: str,
+    cache_branch: str,
+    cache_key: str | None,
+    cached: bool,
+) -> dict:
+    """
+    Write an executed notebook and its thumbnail to ``EXEC_IPYNB_ROOT``
+
+    The notebook is cached as executed, and then written with its large
+    outputs moved into the repository's ``OUTPUTS_DIR_NAME`` directory.
+    Returns the report from :func:`apply_output_budget`.
+    """
+    src_rel = src.relative_to(SRC_IPYNB_ROOT)
 
     # Store the tag used to execute the notebook in metadata
     set_metadata(nb, "src_repo_tag", tag)
@@ -232,6 +473,29 @@ def execute_notebook(
     with open(dst, "w", encoding="utf-8") as f:
         nbformat.write(nb, f)
 
+    # Cache the executed notebook for next time
+    if cache_key is not None and not cached:
+        store_cached_notebook(cache_key, dst)
+
+    # Keep the notebook within its output budget. The cache keeps the
+    # original, as the outputs directory may not survive until next time
+    user, repo, *_ = src_rel.parts
+    output_budget = apply_output_budget(
+        nb, dst.parent, EXEC_IPYNB_ROOT / user / repo / OUTPUTS_DIR_NAME
+    )
+    if (
+        output_budget["externalized"]
+        or output_budget["truncated"]
+        or output_budget["widget_state_dropped"]
+    ):
+        with open(dst, "w", encoding="utf-8") as f:
+            nbformat.write(nb, f)
+    if output_budget["over_budget"]:
+        print(
+            f"{src_rel} is {output_budget['bytes'] / 1024**2:.1f} MiB,",
+            "which is over budget",
+        )
+
     # Copy the thumbnail
     thumbnail_path = src.with_name(THUMBNAIL_FILENAME)
     if thumbnail_path.is_file():
@@ -240,16 +504,227 @@ def execute_notebook(
             EXEC_IPYNB_ROOT / thumbnail_path.relative_to(SRC_IPYNB_ROOT),
         )
 
-    print("Successfully executed", src.relative_to(SRC_IPYNB_ROOT))
+    print("Successfully executed", src_rel)
+    return output_budget
+
+
+def execute_notebook(
+    src_and_tag: Tuple[Path, str],
+    cache_branch: str,
+    use_cache: bool = True,
+    notebook_envs: bool = False,
+    cores: int | None = None,
+) -> dict:
+    """
+    Execute a notebook and retain its widget state
+
+    If ``use_cache`` is ``True`` and the notebook has already been executed with
+    the same inputs, the executed notebook is restored from the execution cache
+    without starting a kernel. The notebook is executed in the kernel given by
+    :func:`notebook_kernel`; with ``notebook_envs``, its environment must
+    already have been built. The kernel's threads are limited to ``cores``,
+    the cores in the budget the notebook is scheduled in.
+
+    Returns a dict recording the notebook's path relative to ``SRC_IPYNB_ROOT``
+    as ``"src"``, whether it was restored from the cache as ``"cached"``, the
+    wall time in seconds taken to produce it as ``"duration"``, and the
+    ``"profile"`` recorded when it was executed (see
+    :meth:`NotebookExecutor.profile`), and the ``"output_budget"`` report
+    from :func:`save_executed_notebook`.
+    """
+    start = perf_counter()
+
+    # Unpack the argument
+    src, tag = src_and_tag
+
+    # Get the source
+    src_rel = src.relative_to(SRC_IPYNB_ROOT)
+    kernel_name = notebook_kernel(src, notebook_envs)
+
+    nb, cache_key, cached = load_notebook(src, tag, use_cache, kernel_name)
+
+    if not cached:
+        executor = NotebookExecutor(
+            kernel_name=kernel_name,
+            timeout=1200,
+        )
+        executor.store_widget_state = True
+        # Keep the kernel to the threads it was scheduled for
+        executor.kernel_env = thread_env(notebook_resources(nb, cores)[0])
+        # Take a kernel that has already done its imports if we have one
+        km = None
+        if _warm_kernels is not None:
+            km = _warm_kernels.take(kernel_name, src.parent, env=executor.kernel_env)
+            executor.kernel_start_time = _warm_kernels.wait_time
+        # Execute the notebook
+        try:
+            executor.preprocess(nb, {"metadata": {"path": src.parent}}, km=km)
+        except Exception as e:
+            print("Failed to execute", src.relative_to(SRC_IPYNB_ROOT))
+            raise NotebookExceptionError(str(src_rel), e)
+        finally:
+            # Kernels we pass in are ours to shut down
+            if km is not None:
+                if executor.kc is not None:
+                    executor.kc.stop_channels()
+                km.shutdown_kernel(now=True)
+
+        report_profile(nb, src_rel, executor)
 
+    output_budget = save_executed_notebook(
+        nb, src, tag, cache_branch, cache_key, cached
+    )
+
+    return {
+        "src": str(src_rel),
+        "cached": cached,
+        "duration": perf_counter() - start,
+        "profile": get_metadata(nb, "cookbook_profile", None),
+        "output_budget": output_budget,
+    }
+
+
+async def execute_notebook_async(
+    src_and_tag: Tuple[Path, str],
+    cache_branch: str,
+    use_cache: bool = True,
+    timeout: float | None = None,
+    notebook_envs: bool = False,
+    cores: int | None = None,
+) -> dict:
+    """
+    Execute a notebook in the running event loop and retain its widget state
 
-def delay_iterator(iterator, seconds=1.0):
-    """Introduce a delay to iteration.
+    Equivalent to :func:`execute_notebook`, except that the whole notebook is
+    subject to ``timeout`` seconds; individual cells are still limited as
+    usual.
+    """
+    start = perf_counter()
 
-    This may be helpful to avoid race conditions with process pools."""
-    for item in iterator:
-        yield item
-        sleep(seconds)
+    src, tag = src_and_tag
+    src_rel = src.relative_to(SRC_IPYNB_ROOT)
+    kernel_name = notebook_kernel(src, notebook_envs)
+
+    nb, cache_key, cached = await asyncio.to_thread(
+        load_notebook, src, tag, use_cache, kernel_name
+    )
+
+    if not cached:
+        executor = NotebookExecutor(
+            kernel_name=kernel_name,
+            timeout=1200,
+        )
+        executor.store_widget_state = True
+        executor.kernel_env = thread_env(notebook_resources(nb, cores)[0])
+        execution = asyncio.ensure_future(
+            executor.async_preprocess(nb, {"metadata": {"path": src.parent}})
+        )
+        try:
+            done, _ = await asyncio.wait([execution], timeout=timeout)
+        except asyncio.CancelledError:
+            execution.cancel()
+            raise
+        if not done:
+            print("Timed out executing", src_rel)
+            # nbclient reports being cancelled as a dead kernel and leaves its
+            # tasks running, so kill the kernel and let nbclient clean up
+            if executor.km is not None and executor.km.has_kernel:
+                await ensure_async(executor.km.signal_kernel(signal.SIGKILL))
+            else:
+                execution.cancel()
+            await asyncio.gather(execution, return_exceptions=True)
+            raise NotebookExceptionError(
+                str(src_rel),
+                TimeoutError(
+                    f"Notebook did not finish within --notebook-timeout={timeout} s"
+                ),
+            )
+        try:
+            execution.result()
+        except Exception as e:
+            print("Failed to execute", src_rel)
+            raise NotebookExceptionError(str(src_rel), e)
+
+        report_profile(nb, src_rel, executor)
+
+    output_budget = await asyncio.to_thread(
+        save_executed_notebook, nb, src, tag, cache_branch, cache_key, cached
+    )
+
+    return {
+        "src": str(src_rel),
+        "cached": cached,
+        "duration": perf_counter() - start,
+        "profile": get_metadata(nb, "cookbook_profile", None),
+        "output_budget": output_budget,
+    }
+
+
+async def execute_notebooks_async(
+    notebooks: List[Tuple[Path, str]],
+    cache_branch: str,
+    use_cache: bool = True,
+    concurrency: int | None = None,
+    timeout: float | None = None,
+    kernel_start_delay: float = 0.0,
+    notebook_envs: bool = False,
+    budget: ResourceBudget | None = None,
+) -> List[dict | NotebookExceptionError]:
+    """
+    Execute notebooks concurrently from a single process.
+
+    Notebooks are started strictly in the order given, each as soon as the
+    threads and memory it needs (see
+    :func:`cookbook.scheduling.notebook_resources`) fit in ``budget``. By default, this is all the machine's cores and memory, and
+    at most ``concurrency`` notebooks (by default, the number of CPUs) are
+    executed at once. Notebooks that fail are reported by returning their
+    :class:`NotebookExceptionError`; any other exception cancels the
+    remaining notebooks and is raised.
+    """
+    if budget is None:
+        budget = ResourceBudget(*machine_resources(), concurrency or os.cpu_count())
+    budget_changed = asyncio.Condition()
+    init_kernel_start_throttle(asyncio.Lock(), kernel_start_delay)
+    # Index of the next notebook to start; later notebooks wait their turn
+    next_to_start = 0
+
+    async def run(
+        index: int, src_and_tag: Tuple[Path, str]
+    ) -> dict | NotebookExceptionError:
+        nonlocal next_to_start
+        with open(src_and_tag[0]) as f:
+            request = notebook_resources(json.load(f), budget.cores)
+        async with budget_changed:
+            await budget_changed.wait_for(
+                lambda: next_to_start == index and budget.fits(request)
+            )
+            budget.claim(request)
+            next_to_start += 1
+            budget_changed.notify_all()
+        try:
+            return await execute_notebook_async(
+                src_and_tag,
+                cache_branch=cache_branch,
+                use_cache=use_cache,
+                timeout=timeout,
+                notebook_envs=notebook_envs,
+                cores=budget.cores,
+            )
+        except NotebookExceptionError as e:
+            return e
+        finally:
+            async with budget_changed:
+                budget.release(request)
+                budget_changed.notify_all()
+
+    # The task group cancels every other task if any raises
+    async with asyncio.TaskGroup() as group:
+        tasks = [
+            group.create_task(run(index, notebook))
+            for index, notebook in enumerate(notebooks)
+        ]
+
+    return [task.result() for task in tasks]
 
 
 def clean_up_notebook(notebook: Path):
@@ -264,35 +739,252 @@ def clean_up_notebook(notebook: Path):
     exec_notebook.unlink()
 
 
+def proc_inputs_key(
+    src: Path,
+    tag: str,
+    cache_branch: str,
+    archive_options: str = "",
+) -> str:
+    """Get a hash of everything that the Colab and download versions depend on"""
+    return hash_files(
+        [(src, Path(src.name)), *needed_files(src)],
+        tag,
+        cache_branch,
+        archive_options,
+    )
+
+
+def exec_inputs_key(
+    src: Path,
+    tag: str,
+    cache_branch: str,
+    kernel_name: str = KERNEL_NAME,
+) -> str:
+    """
+    Get a hash of everything that the executed version of a notebook depends on
+
+    This is everything in its :func:`execution_cache_key`, plus the cache
+    branch recorded in its metadata. Archive options don't affect it.
+    """
+    return hash_files([], execution_cache_key(src, tag, kernel_name), cache_branch)
+
+
+def proc_outputs(notebook: Path) -> List[Path]:
+    """Get the paths written by ``create_colab_notebook`` and ``create_download``"""
+    return [notebook_colab(notebook).parent, notebook_download(notebook)]
+
+
+def exec_outputs(notebook: Path) -> List[Path]:
+    """Get the paths written by ``execute_notebook``"""
+    exec_notebook = EXEC_IPYNB_ROOT / notebook.relative_to(SRC_IPYNB_ROOT)
+    return [exec_notebook, exec_notebook.with_name(THUMBNAIL_FILENAME)]
+
+
+def prune_shared_outputs(manifest: dict[str, dict]):
+    """
+    Delete files in the repositories' ``OUTPUTS_DIR_NAME`` directories that no
+    executed notebook in the manifest uses any more
+    """
+    used = {
+        path
+        for entry in manifest.values()
+        for path in entry.get("exec", {}).get("shared", [])
+    }
+    for path in EXEC_IPYNB_ROOT.glob(f"*/*/{OUTPUTS_DIR_NAME}/*"):
+        if str(path.relative_to(OPENFF_DOCS_ROOT)) not in used:
+            print("Removing unused output", path.relative_to(EXEC_IPYNB_ROOT))
+            path.unlink(missing_ok=True)
+
+
+def remove_outputs(paths: List[str]):
+    """Delete output files and directories, given relative to ``OPENFF_DOCS_ROOT``"""
+    for path in map(OPENFF_DOCS_ROOT.joinpath, paths):
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink(missing_ok=True)
+
+
+def load_manifest() -> dict[str, dict]:
+    """
+    Load the manifest of processed notebooks from ``MANIFEST_PATH``.
+
+    The manifest maps the path of each notebook relative to ``SRC_IPYNB_ROOT``
+    to a dict with an entry for each stage (``"proc"`` and ``"exec"``) that has
+    succeeded for that notebook. Each stage records the ``"inputs"`` key it was
+    run with and the ``"outputs"`` it wrote, relative to ``OPENFF_DOCS_ROOT``.
+    Outputs that other notebooks may also use are recorded separately as
+    ``"shared"``.
+    """
+    try:
+        return json.loads(MANIFEST_PATH.read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(manifest: dict[str, dict]):
+    """Atomically write the manifest of processed notebooks to ``MANIFEST_PATH``"""
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = MANIFEST_PATH.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    tmp_path.replace(MANIFEST_PATH)
+
+
+def stage_is_current(entry: dict, stage: str, key: str) -> bool:
+    """Check whether a stage's outputs in a manifest entry are up to date"""
+    record = entry.get(stage)
+    # Records from before shared outputs were recorded are out of date, or
+    # their shared outputs would be pruned
+    return (
+        record is not None
+        and record["inputs"] == key
+        and "shared" in record
+        and all(
+            OPENFF_DOCS_ROOT.joinpath(path).exists()
+            for path in [*record["outputs"], *record["shared"]]
+        )
+    )
+
+
+def reset_stage(entry: dict, stage: str):
+    """
+    Delete a stage's outputs and remove it from a manifest entry
+
+    Shared outputs are left for :func:`prune_shared_outputs`.
+    """
+    remove_outputs(entry.pop(stage, {}).get("outputs", []))
+
+
+def record_stage(
+    entry: dict,
+    stage: str,
+    key: str,
+    outputs: List[Path],
+    shared: List[Path] | None = None,
+):
+    """
+    Record a successful stage and the outputs it wrote in a manifest entry
+
+    ``shared`` outputs may also be used by other notebooks, so they are not
+    deleted along with the stage's other outputs.
+    """
+    entry[stage] = {
+        "inputs": key,
+        "outputs": [
+            str(path.relative_to(OPENFF_DOCS_ROOT)) for path in outputs if path.exists()
+        ],
+        "shared": [
+            str(path.relative_to(OPENFF_DOCS_ROOT))
+            for path in shared or []
+            if path.exists()
+        ],
+    }
+
+
+def load_runtimes() -> dict[str, float]:
+    """
+    Load the historical execution time of each notebook from ``RUNTIMES_PATH``.
+
+    Maps paths relative to ``SRC_IPYNB_ROOT`` to wall times in seconds.
+    """
+    try:
+        return json.loads(RUNTIMES_PATH.read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def save_runtimes(runtimes: dict[str, float]):
+    """Write the execution time of each notebook to ``RUNTIMES_PATH``"""
+    RUNTIMES_PATH.parent.mkdir(parents=True, exist_ok=True)
+    RUNTIMES_PATH.write_text(json.dumps(runtimes, indent=1, sort_keys=True))
+
+
+def longest_first(
+    notebooks: List[Tuple[Path, str]],
+    runtimes: dict[str, float],
+) -> List[Tuple[Path, str]]:
+    """
+    Sort notebooks so that those that took longest last time come first.
+
+    Notebooks without a recorded runtime are assumed to be slow, so that new
+    notebooks don't end up as the stragglers.
+    """
+    return sorted(
+        notebooks,
+        key=lambda pair: -runtimes.get(
+            str(pair[0].relative_to(SRC_IPYNB_ROOT)), float("inf")
+        ),
+    )
+
+
+def download_examples(repo: str) -> Tuple[Path, str]:
+    """
+    Download the examples from a repository in ``GITHUB_REPOS``.
+
+    Returns the path the examples were downloaded to and the tag they were
+    downloaded from.
+    """
+    repo, _, tag = repo.partition("#")
+
+    dst_path = SRC_IPYNB_ROOT / repo
+    tag = tag or get_tag_matching_installed_version(repo)
+
+    print(f"Downloading {repo}#{tag} to {dst_path.resolve()}")
+
+    download_dir(
+        repo,
+        REPO_EXAMPLES_DIR,
+        dst_path,
+        refspec=tag,
+    )
+
+    return dst_path, tag
+
+
 def main(
     cache_branch: str,
     do_proc=True,
     do_exec=True,
     prefix: Path | None = None,
     processes: int | None = None,
+    proc_workers: int | None = None,
+    proc_pool: str = "thread",
+    archive_format: str = DEFAULT_ARCHIVE_FORMAT,
+    archive_level: int | None = None,
+    reproducible_archives: bool = True,
     failed_notebooks_log: Path | None = None,
     allow_failures: bool = False,
+    use_exec_cache: bool = True,
+    incremental: bool = False,
+    kernel_start_delay: float = 0.0,
+    engine: str = "pool",
+    notebook_timeout: float | None = None,
+    profile_report: Path | None = None,
+    notebook_envs: bool = False,
+    cores: int | None = None,
+    memory_gib: float | None = None,
 ):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine}; try one of {ENGINES}")
+    if proc_pool not in PROC_POOLS:
+        raise ValueError(f"Unknown pool {proc_pool}; try one of {[*PROC_POOLS]}")
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(
+            f"Unknown archive format {archive_format}; try one of {[*ARCHIVE_FORMATS]}"
+        )
+
     print("Working in", Path().resolve())
 
+    # The notebooks written here mustn't be replaced by the cache's
+    CACHE_STAMP_PATH.unlink(missing_ok=True)
+
     notebooks: List[Tuple[Path, str]] = []
     # Download the examples from latest releases on GitHub
     shutil.rmtree(SRC_IPYNB_ROOT, ignore_errors=True)
-    for repo in GITHUB_REPOS:
-        repo, _, tag = repo.partition("#")
-
-        dst_path = SRC_IPYNB_ROOT / repo
-        tag = tag or get_tag_matching_installed_version(repo)
-
-        print(f"Downloading {repo}#{tag} to {dst_path.resolve()}")
-
-        download_dir(
-            repo,
-            REPO_EXAMPLES_DIR,
-            dst_path,
-            refspec=tag,
-        )
+    with ThreadPoolExecutor() as pool:
+        downloads = [*pool.map(download_examples, GITHUB_REPOS)]
 
+    for dst_path, tag in downloads:
         # Find the notebooks we need to process
         notebooks.extend(
             (notebook, tag)
@@ -300,33 +992,253 @@ def main(
             if str(notebook.relative_to(SRC_IPYNB_ROOT)) not in SKIP_NOTEBOOKS
         )
 
+    # Work out which notebooks have changed since the last run
+    old_manifest = load_manifest() if incremental else {}
+    manifest: dict[str, dict] = {}
+    proc_keys: dict[Path, str] = {}
+    exec_keys: dict[Path, str] = {}
+    kernels: dict[Path, str] = {}
+    for notebook, tag in notebooks:
+        src_rel = str(notebook.relative_to(SRC_IPYNB_ROOT))
+        kernels[notebook] = notebook_kernel(notebook, notebook_envs)
+        proc_keys[notebook] = proc_inputs_key(
+            notebook,
+            tag,
+            cache_branch,
+            f"{archive_format}:{archive_level}:{reproducible_archives}",
+        )
+        exec_keys[notebook] = exec_inputs_key(
+            notebook, tag, cache_branch, kernels[notebook]
+        )
+        manifest[src_rel] = old_manifest.pop(src_rel, {})
+
+    # Delete the outputs of notebooks that have disappeared upstream
+    for src_rel, entry in old_manifest.items():
+        print("Removing outputs of deleted notebook", src_rel)
+        for stage in [*entry]:
+            reset_stage(entry, stage)
+
     # Create Colab and downloadable versions of the notebooks
+    processing_failed = False
     if do_proc:
-        shutil.rmtree(COLAB_IPYNB_ROOT, ignore_errors=True)
-        shutil.rmtree(DOWNLOAD_IPYNB_ROOT, ignore_errors=True)
+        if not incremental:
+            shutil.rmtree(COLAB_IPYNB_ROOT, ignore_errors=True)
+            shutil.rmtree(DOWNLOAD_IPYNB_ROOT, ignore_errors=True)
+        to_process: List[Path] = []
         for notebook, _ in notebooks:
-            print("Processing", notebook)
-            create_colab_notebook(notebook, cache_branch)
-            create_download(notebook)
+            entry = manifest[str(notebook.relative_to(SRC_IPYNB_ROOT))]
+            if stage_is_current(entry, "proc", proc_keys[notebook]):
+                print("Skipping unchanged", notebook)
+                continue
+            # Bare notebooks' Colab folders are named for their contents, so
+            # clear out whatever was generated from the previous version
+            reset_stage(entry, "proc")
+            to_process.append(notebook)
+
+        # Notebooks in the same folder share a Colab folder and a download
+        # archive, so each such group is processed by a single worker
+        groups: dict[Tuple[Path, Path], List[Path]] = {}
+        for notebook in to_process:
+            outputs = (
+                notebook_colab(notebook).parent,
+                notebook_download(notebook, archive_format),
+            )
+            groups.setdefault(outputs, []).append(notebook)
+
+        # Report each notebook as soon as it's done, rather than in order
+        proc_exceptions: list[NotebookExceptionError] = []
+        with PROC_POOLS[proc_pool](max_workers=proc_workers) as pool:
+            futures = [
+                pool.submit(
+                    process_notebooks,
+                    group,
+                    cache_branch,
+                    archive_format,
+                    archive_level,
+                    reproducible_archives,
+                )
+                for group in groups.values()
+            ]
+            for future in as_completed(futures):
+                for result in future.result():
+                    if isinstance(result, Exception):
+                        print("Failed to process", result.src)
+                        proc_exceptions.append(result)
+                    else:
+                        print("Processed", result)
+                        notebook = SRC_IPYNB_ROOT / result
+                        record_stage(
+                            manifest[result],
+                            "proc",
+                            proc_keys[notebook],
+                            proc_outputs(notebook),
+                        )
+        save_manifest(manifest)
+        prune_blobs()
+
+        for exception in proc_exceptions:
+            print(
+                "-" * 80
+                + "\n"
+                + f"{exception.src} could not be processed. Traceback:\n\n{exception.tb}"
+            )
+            if not in_regexes(exception.src, OPTIONAL_NOTEBOOKS):
+                processing_failed = True
 
     # Execute notebooks in parallel for rendering as HTML
     execution_failed = False
     if do_exec:
-        shutil.rmtree(EXEC_IPYNB_ROOT, ignore_errors=True)
-        # Context manager ensures the pool is correctly terminated if there's
-        # an exception
-        with Pool(processes=processes) as pool:
-            # Wait a second between launching subprocesses
-            # Workaround https://github.com/jupyter/nbconvert/issues/1066
-            exec_results = [
-                *pool.imap(
-                    to_result(
-                        partial(execute_notebook, cache_branch=cache_branch),
-                        NotebookExceptionError,
-                    ),
-                    delay_iterator(notebooks),
+        if not incremental:
+            shutil.rmtree(EXEC_IPYNB_ROOT, ignore_errors=True)
+        to_execute: List[Tuple[Path, str]] = []
+        for notebook, tag in notebooks:
+            entry = manifest[str(notebook.relative_to(SRC_IPYNB_ROOT))]
+            if stage_is_current(entry, "exec", exec_keys[notebook]):
+                print("Skipping unchanged", notebook)
+                continue
+            reset_stage(entry, "exec")
+            to_execute.append((notebook, tag))
+
+        # Start the longest notebooks first so they don't hold up the end of
+        # the run
+        runtimes = load_runtimes()
+        to_execute = longest_first(to_execute, runtimes)
+
+        # Build each notebook-specific environment once, before any kernels
+        # start. Builds run one at a time because they share a package cache
+        env_exceptions: list[NotebookExceptionError] = []
+        if notebook_envs:
+            os.environ["JUPYTER_PATH"] = os.pathsep.join(
+                filter(None, [str(ENV_KERNELS_ROOT), os.environ.get("JUPYTER_PATH")])
+            )
+            env_errors: dict[str, Exception] = {}
+            for notebook, _ in to_execute:
+                env_file = packaged_env_file(notebook)
+                if env_file is None or kernels[notebook] in env_errors:
+                    continue
+                try:
+                    build_env(env_file)
+                except Exception as e:
+                    print("Failed to create environment from", env_file)
+                    env_errors[kernels[notebook]] = e
+            env_exceptions = [
+                NotebookExceptionError(
+                    str(notebook.relative_to(SRC_IPYNB_ROOT)),
+                    env_errors[kernels[notebook]],
                 )
+                for notebook, _ in to_execute
+                if kernels[notebook] in env_errors
             ]
+            to_execute = [
+                (notebook, tag)
+                for notebook, tag in to_execute
+                if kernels[notebook] not in env_errors
+            ]
+            # The packages in an environment are only known once it's built
+            for notebook, tag in to_execute:
+                exec_keys[notebook] = exec_inputs_key(
+                    notebook, tag, cache_branch, kernels[notebook]
+                )
+            # Run notebooks that share an environment together, so workers
+            # reuse their warm kernels. The sort is stable, so each group
+            # still starts with its longest notebooks
+            to_execute.sort(key=lambda notebook_and_tag: kernels[notebook_and_tag[0]])
+
+        # Pack notebooks onto the cores and memory they say they need
+        machine_cores, machine_memory = machine_resources()
+        budget = ResourceBudget(
+            machine_cores if cores is None else cores,
+            machine_memory if memory_gib is None else int(memory_gib * 1024**3),
+            processes or os.cpu_count(),
+        )
+
+        if engine == "async":
+            exec_results = asyncio.run(
+                execute_notebooks_async(
+                    to_execute,
+                    cache_branch=cache_branch,
+                    use_cache=use_exec_cache,
+                    concurrency=processes,
+                    timeout=notebook_timeout,
+                    kernel_start_delay=kernel_start_delay,
+                    notebook_envs=notebook_envs,
+                    budget=budget,
+                )
+            )
+        else:
+            # Context manager ensures the pool is correctly terminated if there's
+            # an exception
+            # Workers take turns to start their kernels, and then execute freely
+            # Workaround https://github.com/jupyter/nbconvert/issues/1066
+            with Pool(
+                processes=processes,
+                initializer=init_worker,
+                initargs=(Lock(), kernel_start_delay, engine == "warm"),
+            ) as pool:
+                requests = []
+                for notebook, tag in to_execute:
+                    with open(notebook) as f:
+                        requests.append(
+                            (
+                                (notebook, tag),
+                                notebook_resources(json.load(f), budget.cores),
+                            )
+                        )
+                exec_results = [
+                    *imap_packed(
+                        pool,
+                        to_result(
+                            partial(
+                                execute_notebook,
+                                cache_branch=cache_branch,
+                                use_cache=use_exec_cache,
+                                notebook_envs=notebook_envs,
+                                cores=budget.cores,
+                            ),
+                            NotebookExceptionError,
+                        ),
+                        requests,
+                        budget,
+                    )
+                ]
+                # Let the workers exit cleanly so they shut down their kernels
+                pool.close()
+                pool.join()
+        exec_results.extend(env_exceptions)
+
+        for result in exec_results:
+            if not isinstance(result, Exception):
+                entry = manifest[result["src"]]
+                notebook = SRC_IPYNB_ROOT / result["src"]
+                record_stage(
+                    entry,
+                    "exec",
+                    exec_keys[notebook],
+                    exec_outputs(notebook),
+                    shared=[
+                        Path(path)
+                        for path in result["output_budget"]["externalized_files"]
+                    ],
+                )
+                # Cache hits say nothing about how long the notebook takes
+                if not result["cached"]:
+                    runtimes[result["src"]] = result["duration"]
+        save_manifest(manifest)
+        save_runtimes(runtimes)
+        prune_shared_outputs(manifest)
+
+        if profile_report is not None:
+            write_profile_report(
+                profile_report,
+                [
+                    result
+                    for result in exec_results
+                    if not isinstance(result, Exception)
+                ],
+            )
+
+        if use_exec_cache:
+            evict_cache()
 
         exceptions: list[NotebookExceptionError] = [
             result for result in exec_results if isinstance(result, Exception)
@@ -349,6 +1261,18 @@ def main(
                 print("    ", exception.src)
             print("For tracebacks, see above.")
 
+        # Notebooks that are too big still render, so they don't fail the run
+        over_budget = [
+            result["src"]
+            for result in exec_results
+            if not isinstance(result, Exception)
+            and result["output_budget"]["over_budget"]
+        ]
+        if over_budget:
+            print(f"The following {len(over_budget)} notebooks are over budget:")
+            for src in over_budget:
+                print("    ", src)
+
         if failed_notebooks_log is not None:
             print(f"Writing log to {failed_notebooks_log.absolute()}")
             failed_notebooks_log.write_text(
@@ -363,6 +1287,7 @@ def main(
                             if exc not in ignored_exceptions
                         ],
                         "ignored": [exc.src for exc in ignored_exceptions],
+                        "over_budget": over_budget,
                     }
                 )
             )
@@ -376,12 +1301,20 @@ def main(
             DOWNLOAD_IPYNB_ROOT,
             SRC_IPYNB_ROOT,
         ]:
-            shutil.move(
-                directory,
-                prefix / directory.relative_to(OPENFF_DOCS_ROOT),
-            )
+            # Incremental runs need the outputs to still be here next time
+            if incremental:
+                shutil.copytree(
+                    directory,
+                    prefix / directory.relative_to(OPENFF_DOCS_ROOT),
+                    dirs_exist_ok=True,
+                )
+            else:
+                shutil.move(
+                    directory,
+                    prefix / directory.relative_to(OPENFF_DOCS_ROOT),
+                )
 
-    if execution_failed:
+    if processing_failed or execution_failed:
         exit(1)
 
 
@@ -413,6 +1346,110 @@ if __name__ == "__main__":
             "Specify processes in a single argument: `--processes=<processes>`"
         )
 
+    # --proc-workers is the number of notebooks to create Colab and
+    # downloadable versions of at once
+    proc_workers = None
+    for arg in sys.argv:
+        if arg.startswith("--proc-workers="):
+            proc_workers = int(arg[15:])
+    if "--proc-workers" in sys.argv:
+        raise ValueError(
+            "Specify workers in a single argument: `--proc-workers=<workers>`"
+        )
+
+    # --proc-pool is whether to create them in threads or processes
+    proc_pool = "thread"
+    for arg in sys.argv:
+        if arg.startswith("--proc-pool="):
+            proc_pool = arg[12:]
+    if "--proc-pool" in sys.argv:
+        raise ValueError("Specify pool in a single argument: `--proc-pool=<pool>`")
+    if proc_pool not in PROC_POOLS:
+        raise ValueError(f"Unknown pool {proc_pool}; try one of {[*PROC_POOLS]}")
+
+    # --archive-format is the format to write downloadable notebooks in
+    archive_format = DEFAULT_ARCHIVE_FORMAT
+    for arg in sys.argv:
+        if arg.startswith("--archive-format="):
+            archive_format = arg[17:]
+    if "--archive-format" in sys.argv:
+        raise ValueError(
+            "Specify format in a single argument: `--archive-format=<format>`"
+        )
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(
+            f"Unknown archive format {archive_format}; try one of {[*ARCHIVE_FORMATS]}"
+        )
+
+    # --archive-level is the compression level of downloadable notebooks
+    archive_level = None
+    for arg in sys.argv:
+        if arg.startswith("--archive-level="):
+            archive_level = int(arg[16:])
+    if "--archive-level" in sys.argv:
+        raise ValueError(
+            "Specify level in a single argument: `--archive-level=<level>`"
+        )
+
+    # --kernel-start-delay is the time in seconds to keep other kernels waiting
+    # after a kernel has started
+    kernel_start_delay = 0.0
+    for arg in sys.argv:
+        if arg.startswith("--kernel-start-delay="):
+            kernel_start_delay = float(arg[21:])
+    if "--kernel-start-delay" in sys.argv:
+        raise ValueError(
+            "Specify delay in a single argument: `--kernel-start-delay=<seconds>`"
+        )
+
+    # --cores is the number of cores to share between executing notebooks
+    cores = None
+    for arg in sys.argv:
+        if arg.startswith("--cores="):
+            cores = int(arg[8:])
+    if "--cores" in sys.argv:
+        raise ValueError("Specify cores in a single argument: `--cores=<cores>`")
+
+    # --memory is the memory in GiB to share between executing notebooks
+    memory_gib = None
+    for arg in sys.argv:
+        if arg.startswith("--memory="):
+            memory_gib = float(arg[9:])
+    if "--memory" in sys.argv:
+        raise ValueError("Specify memory in a single argument: `--memory=<GiB>`")
+
+    # --engine is the strategy used to execute notebooks
+    engine = "pool"
+    for arg in sys.argv:
+        if arg.startswith("--engine="):
+            engine = arg[9:]
+    if "--engine" in sys.argv:
+        raise ValueError("Specify engine in a single argument: `--engine=<engine>`")
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine}; try one of {ENGINES}")
+
+    # --notebook-timeout is the time in seconds each notebook may take to execute
+    notebook_timeout = None
+    for arg in sys.argv:
+        if arg.startswith("--notebook-timeout="):
+            notebook_timeout = float(arg[19:])
+    if "--notebook-timeout" in sys.argv:
+        raise ValueError(
+            "Specify timeout in a single argument: `--notebook-timeout=<seconds>`"
+        )
+    if notebook_timeout is not None and engine != "async":
+        raise ValueError("--notebook-timeout is only supported with --engine=async")
+
+    # --profile-report is the path to store execution times and memory use in
+    profile_report = None
+    for arg in sys.argv:
+        if arg.startswith("--profile-report="):
+            profile_report = Path(arg[17:])
+    if "--profile-report" in sys.argv:
+        raise ValueError(
+            "Specify path to report in a single argument: `--profile-report=<path>`"
+        )
+
     cache_branch = DEFAULT_CACHE_BRANCH
     for arg in sys.argv:
         if arg.startswith("--cache-branch="):
@@ -457,6 +1494,20 @@ if __name__ == "__main__":
         do_exec=not "--skip-exec" in sys.argv,
         prefix=prefix,
         processes=processes,
+        proc_workers=proc_workers,
+        proc_pool=proc_pool,
+        archive_format=archive_format,
+        archive_level=archive_level,
+        reproducible_archives=not "--no-reproducible-archives" in sys.argv,
         failed_notebooks_log=failed_notebooks_log,
         allow_failures=allow_failures,
+        use_exec_cache=not "--no-exec-cache" in sys.argv,
+        incremental="--incremental" in sys.argv,
+        kernel_start_delay=kernel_start_delay,
+        engine=engine,
+        notebook_timeout=notebook_timeout,
+        profile_report=profile_report,
+        notebook_envs="--notebook-envs" in sys.argv,
+        cores=cores,
+        memory_gib=memory_gib,
     )